@@ -0,0 +1,705 @@
+from query_utils import tokenize
+
+RDF_TYPE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+
+_FORMS = {"SELECT", "CONSTRUCT", "ASK", "DESCRIBE"}
+_AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX", "SAMPLE", "GROUP_CONCAT"}
+_MODIFIERS = {"GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET", "VALUES"}
+# String functions a FILTER has to evaluate row by row, without help from an index
+_EXPENSIVE_FUNCTIONS = {"REGEX", "CONTAINS", "STRSTARTS", "STRENDS", "REPLACE", "LCASE", "UCASE"}
+
+SEVERITY_POINTS = {"medium": 1, "high": 3}
+COST_CLASSES = ("low", "medium", "high", "extreme")
+GUARD_MODES = ("off", "warn", "limit", "block")
+
+
+class QueryParseError(ValueError):
+    """
+    Raised when a query cannot be parsed far enough to be analyzed.
+    """
+
+
+# Algebra nodes. Terms are (kind, text) pairs where kind is "var" (variables
+# and blank nodes, which join like variables), "const" or "path".
+
+class Triple:
+    def __init__(self, subject: tuple, predicate: tuple, object: tuple):
+        self.subject = subject
+        self.predicate = predicate
+        self.object = object
+
+    def variables(self) -> set:
+        return {text for kind, text in (self.subject, self.predicate, self.object) if kind == "var"}
+
+    def __repr__(self):
+        return f"Triple({self.subject[1]} {self.predicate[1]} {self.object[1]})"
+
+
+class Group:
+    """
+    A group graph pattern: its elements in order, which are Triples and
+    the other nodes below.
+    """
+
+    def __init__(self, elements: list | None = None):
+        self.elements = elements or []
+
+    def variables(self) -> set:
+        found = set()
+        for element in self.elements:
+            found |= element.variables()
+        return found
+
+    def __repr__(self):
+        return f"Group({self.elements})"
+
+
+class Optional:
+    def __init__(self, group: Group):
+        self.group = group
+
+    def variables(self) -> set:
+        return self.group.variables()
+
+
+class Minus(Optional):
+    pass
+
+
+class Union:
+    def __init__(self, groups: list):
+        self.groups = groups
+
+    def variables(self) -> set:
+        return set().union(*(group.variables() for group in self.groups))
+
+
+class Graph:
+    """
+    A GRAPH or SERVICE block.
+    """
+
+    def __init__(self, keyword: str, name: tuple, group: Group):
+        self.keyword = keyword
+        self.name = name
+        self.group = group
+
+    def variables(self) -> set:
+        return self.group.variables() | ({self.name[1]} if self.name[0] == "var" else set())
+
+
+class Filter:
+    """
+    A FILTER constraint: its tokens, the functions it calls, and the groups
+    of any EXISTS or NOT EXISTS inside it.
+    """
+
+    def __init__(self, tokens: list, functions: list, groups: list):
+        self.tokens = tokens
+        self.functions = functions
+        self.groups = groups
+
+    def variables(self) -> set:
+        # Filters restrict the solutions of their group but don't join with it
+        return set()
+
+    def mentioned(self) -> list:
+        return list(dict.fromkeys(text for kind, text in self.tokens if kind == "variable"))
+
+
+class Bind:
+    def __init__(self, variables: set):
+        self._variables = variables
+
+    def variables(self) -> set:
+        return set(self._variables)
+
+
+class Values(Bind):
+    pass
+
+
+class Query:
+    """
+    A query or subquery: its form, projection, WHERE pattern and solution
+    modifiers, ORDER BY being a list of (variable, descending) pairs.
+    `modifiers_end` is the offset where a LIMIT can be added.
+    """
+
+    def __init__(self):
+        self.form = None
+        self.distinct = False
+        self.projection = []
+        self.aggregates = []
+        self.where = None
+        self.group_by = False
+        self.order_by = []
+        self.limit = None
+        self.offset = None
+        self.modifiers_end = None
+
+    def variables(self) -> set:
+        if "*" in self.projection and self.where is not None:
+            return self.where.variables()
+        return set(self.projection)
+
+
+class _Parser:
+    def __init__(self, query: str):
+        self.query = query
+        self.tokens = [(kind, text, offset) for kind, text, offset in tokenize(query)
+                       if kind not in ("space", "comment")]
+        self.pos = 0
+        self._anonymous = 0
+
+    # Token helpers
+
+    def peek(self, ahead: int = 0) -> tuple:
+        index = self.pos + ahead
+        return self.tokens[index] if index < len(self.tokens) else (None, "", len(self.query))
+
+    def next(self) -> tuple:
+        token = self.peek()
+        if token[0] is None:
+            raise QueryParseError("Unexpected end of query")
+        self.pos += 1
+        return token
+
+    def at(self, text: str) -> bool:
+        return self.peek()[1] == text
+
+    def at_word(self, *words: str) -> bool:
+        kind, text, _ = self.peek()
+        return kind == "word" and text.upper() in words
+
+    def expect(self, text: str):
+        kind, found, offset = self.next()
+        if found != text:
+            raise QueryParseError(f"Expected '{text}' at offset {offset}, found '{found}'")
+
+    def fresh_blank(self) -> tuple:
+        self._anonymous += 1
+        return ("var", f"_:anon{self._anonymous}")
+
+    def skip_balanced(self, open_text: str, close_text: str) -> list:
+        """
+        Consumes a bracketed run of tokens, starting at `open_text`, and returns the tokens inside.
+        """
+        self.expect(open_text)
+        depth, inside = 1, []
+        while True:
+            token = self.next()
+            if token[1] == open_text:
+                depth += 1
+            elif token[1] == close_text:
+                depth -= 1
+                if depth == 0:
+                    return inside
+            inside.append(token)
+
+    # Query structure
+
+    def parse(self) -> Query:
+        while self.at_word("PREFIX", "BASE"):
+            keyword = self.next()[1].upper()
+            if keyword == "PREFIX":
+                self.next()
+            self.next()
+        query = self.parse_query()
+        if self.at_word("VALUES"):
+            self.next()
+            self.parse_values()
+        if self.peek()[0] is not None:
+            kind, text, offset = self.peek()
+            raise QueryParseError(f"Unexpected '{text}' at offset {offset}")
+        return query
+
+    def parse_query(self) -> Query:
+        query = Query()
+        kind, text, offset = self.next()
+        if kind != "word" or text.upper() not in _FORMS:
+            raise QueryParseError(f"Expected SELECT, CONSTRUCT, ASK or DESCRIBE at offset {offset}")
+        query.form = text.upper()
+
+        if query.form == "SELECT":
+            self.parse_projection(query)
+        elif query.form == "CONSTRUCT" and self.at("{"):
+            self.next()
+            self.parse_group()
+        elif query.form == "DESCRIBE":
+            while not (self.at("{") or self.at_word("WHERE", "FROM", *_MODIFIERS) or self.peek()[0] is None):
+                kind, text, _ = self.next()
+                if kind == "variable" or text == "*":
+                    query.projection.append(text)
+
+        while self.at_word("FROM"):
+            self.next()
+            if self.at_word("NAMED"):
+                self.next()
+            self.next()
+        if self.at_word("WHERE"):
+            self.next()
+        if self.at("{"):
+            self.next()
+            query.where = self.parse_group()
+        elif query.form != "DESCRIBE":
+            raise QueryParseError(f"Expected a WHERE clause at offset {self.peek()[2]}")
+
+        self.parse_modifiers(query)
+        return query
+
+    def parse_projection(self, query: Query):
+        if self.at_word("DISTINCT", "REDUCED"):
+            self.next()
+            query.distinct = True
+        depth = 0
+        while depth > 0 or not (self.at("{") or self.at_word("WHERE", "FROM")):
+            kind, text, _ = self.next()
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                depth -= 1
+            elif kind == "word" and text.upper() in _AGGREGATES:
+                query.aggregates.append(text.upper())
+            elif kind == "word" and text.upper() == "AS" and self.peek()[0] == "variable":
+                query.projection.append(self.next()[1])
+            elif (kind == "variable" and depth == 0) or (text == "*" and depth == 0):
+                query.projection.append(text)
+
+    def parse_modifiers(self, query: Query):
+        while True:
+            if self.at_word("GROUP", "ORDER"):
+                ordering = self.at_word("ORDER")
+                query.group_by = query.group_by or not ordering
+                self.next()
+                if self.at_word("BY"):
+                    self.next()
+                descending = False
+                while True:
+                    if self.at("("):
+                        # An expression is ordered by the first variable in it
+                        inside = [text for kind, text, _ in self.skip_balanced("(", ")") if kind == "variable"]
+                        if ordering and inside:
+                            query.order_by.append((inside[0], descending))
+                        descending = False
+                    elif self.at_word("ASC", "DESC"):
+                        descending = self.next()[1].upper() == "DESC"
+                    elif self.peek()[0] in ("variable", "iri", "pname") or \
+                            (self.peek()[0] == "word" and self.peek(1)[1] == "("):
+                        kind, text, _ = self.next()
+                        if kind == "variable":
+                            if ordering:
+                                query.order_by.append((text, descending))
+                            descending = False
+                    else:
+                        break
+            elif self.at_word("HAVING"):
+                self.next()
+                while self.at("("):
+                    self.skip_balanced("(", ")")
+            elif self.at_word("LIMIT", "OFFSET"):
+                keyword = self.next()[1].lower()
+                kind, text, offset = self.next()
+                if not text.isdigit():
+                    raise QueryParseError(f"Expected a number after {keyword.upper()} at offset {offset}")
+                setattr(query, keyword, int(text))
+            else:
+                break
+        query.modifiers_end = self.peek()[2]
+
+    # Graph patterns
+
+    def parse_group(self) -> Group:
+        """
+        Parses the inside of a group graph pattern, after its opening brace.
+        """
+        group = Group()
+        if self.at_word("SELECT"):
+            subquery = self.parse_query()
+            self.expect("}")
+            group.elements.append(subquery)
+            return group
+
+        while not self.at("}"):
+            kind, text, offset = self.peek()
+            keyword = text.upper() if kind == "word" else None
+            if kind is None:
+                raise QueryParseError("Unclosed group pattern")
+            if text == ".":
+                self.next()
+            elif text == "{":
+                self.next()
+                groups = [self.parse_group()]
+                while self.at_word("UNION"):
+                    self.next()
+                    self.expect("{")
+                    groups.append(self.parse_group())
+                group.elements.append(Union(groups) if len(groups) > 1 else groups[0])
+            elif keyword in ("OPTIONAL", "MINUS"):
+                self.next()
+                self.expect("{")
+                node = Optional if keyword == "OPTIONAL" else Minus
+                group.elements.append(node(self.parse_group()))
+            elif keyword in ("GRAPH", "SERVICE"):
+                self.next()
+                if self.at_word("SILENT"):
+                    self.next()
+                name = self.parse_term([])
+                self.expect("{")
+                group.elements.append(Graph(keyword, name, self.parse_group()))
+            elif keyword == "FILTER":
+                self.next()
+                group.elements.append(self.parse_filter())
+            elif keyword == "BIND":
+                self.next()
+                tokens = self.skip_balanced("(", ")")
+                bound = {text for i, (kind, text, _) in enumerate(tokens)
+                         if kind == "variable" and i > 0 and tokens[i - 1][1].upper() == "AS"}
+                group.elements.append(Bind(bound))
+            elif keyword == "VALUES":
+                self.next()
+                group.elements.append(Values(self.parse_values()))
+            else:
+                self.parse_triples(group.elements)
+        self.next()
+        return group
+
+    def parse_filter(self) -> Filter:
+        start = self.pos
+        groups = []
+        if self.at("("):
+            depth = 0
+            while True:
+                if self.at_word("EXISTS"):
+                    self.next()
+                    self.expect("{")
+                    groups.append(self.parse_group())
+                    continue
+                text = self.next()[1]
+                depth += {"(": 1, ")": -1}.get(text, 0)
+                if depth == 0:
+                    break
+        elif self.at_word("EXISTS", "NOT"):
+            if self.at_word("NOT"):
+                self.next()
+            self.next()
+            self.expect("{")
+            groups.append(self.parse_group())
+        else:
+            # A function call such as regex(...) or <iri>(...)
+            self.next()
+            self.skip_balanced("(", ")")
+        tokens = [(kind, text) for kind, text, _ in self.tokens[start:self.pos]]
+        functions = [text.upper() for i, (kind, text) in enumerate(tokens)
+                     if kind == "word" and i + 1 < len(tokens) and tokens[i + 1][1] == "("]
+        return Filter(tokens, functions, groups)
+
+    def parse_values(self) -> set:
+        variables = set()
+        if self.at("("):
+            variables = {text for kind, text, _ in self.skip_balanced("(", ")") if kind == "variable"}
+        elif self.peek()[0] == "variable":
+            variables = {self.next()[1]}
+        self.skip_balanced("{", "}")
+        return variables
+
+    # Triples
+
+    def parse_triples(self, triples: list):
+        subject = self.parse_term(triples)
+        if subject[0] == "var" and subject[1].startswith("_:anon") and (self.at(".") or self.at("}")):
+            # A blank node property list on its own, e.g. [ dbo:name ?name ] .
+            return
+        self.parse_property_list(subject, triples)
+
+    def parse_property_list(self, subject: tuple, triples: list):
+        while True:
+            predicate = self.parse_verb()
+            while True:
+                triples.append(Triple(subject, predicate, self.parse_term(triples)))
+                if not self.at(","):
+                    break
+                self.next()
+            if not self.at(";"):
+                return
+            while self.at(";"):
+                self.next()
+            if self.at(".") or self.at("]") or self.at("}"):
+                return
+
+    def parse_verb(self) -> tuple:
+        kind, text, _ = self.peek()
+        if kind == "variable":
+            self.next()
+            return ("var", text)
+        path = self.parse_path()
+        if len(path) == 1 and path[0][0] in ("iri", "pname", "word"):
+            return ("const", self._constant(path[0]))
+        return ("path", " ".join(text for _, text in path))
+
+    def parse_path(self) -> list:
+        """
+        Consumes a property path and returns its tokens.
+        """
+        tokens = []
+        while True:
+            while self.at("^") or self.at("!"):
+                tokens.append(self.next()[:2])
+            kind, text, _ = self.peek()
+            if text == "(":
+                tokens.append(self.next()[:2])
+                tokens += self.parse_path()
+                kind, text, offset = self.next()
+                if text != ")":
+                    raise QueryParseError(f"Expected ')' in property path at offset {offset}")
+                tokens.append((kind, text))
+            elif kind in ("iri", "pname") or (kind == "word" and text == "a"):
+                tokens.append(self.next()[:2])
+            else:
+                raise QueryParseError(f"Expected a predicate at offset {self.peek()[2]}, found '{text}'")
+            # The path modifiers *, + and ? must follow the element directly
+            if self.peek()[1] in ("*", "+", "?") and self.peek()[2] == self.tokens[self.pos - 1][2] + len(tokens[-1][1]):
+                tokens.append(self.next()[:2])
+            if self.at("/") or self.at("|"):
+                tokens.append(self.next()[:2])
+            else:
+                return tokens
+
+    def parse_term(self, triples: list) -> tuple:
+        kind, text, offset = self.next()
+        if kind == "variable" or kind == "bnode":
+            return ("var", text)
+        if kind in ("iri", "pname"):
+            return ("const", text)
+        if kind == "string":
+            if self.at("@"):
+                self.next()
+                self.next()
+                while self.at("-") and self.peek(1)[0] == "word":
+                    self.next()
+                    self.next()
+            elif self.at("^") and self.peek(1)[1] == "^":
+                self.next()
+                self.next()
+                self.next()
+            return ("const", text)
+        if text in ("+", "-") and self.peek()[0] == "word":
+            kind, text, offset = self.next()
+        if kind == "word" and (text[0].isdigit() or text.lower() in ("true", "false")):
+            # Decimals are split around the dot by the tokenizer
+            if self.at(".") and self.peek(1)[0] == "word" and self.peek(1)[1][0].isdigit() and \
+                    self.peek()[2] == offset + len(text):
+                self.next()
+                text += "." + self.next()[1]
+            return ("const", text)
+        if text == "[":
+            node = self.fresh_blank()
+            if not self.at("]"):
+                self.parse_property_list(node, triples)
+            self.expect("]")
+            return node
+        if text == "(":
+            node = self.fresh_blank()
+            while not self.at(")"):
+                self.parse_term(triples)
+            self.next()
+            return node
+        raise QueryParseError(f"Unexpected '{text}' at offset {offset}")
+
+    @staticmethod
+    def _constant(token: tuple) -> str:
+        return RDF_TYPE if token == ("word", "a") else token[1]
+
+
+def parse_query(query: str) -> Query:
+    """
+    Parses a SPARQL query into an algebra tree of Query, Group, Triple,
+    Optional, Minus, Union, Graph, Filter, Bind and Values nodes. Raises
+    QueryParseError if the query is not one the parser understands.
+    """
+    return _Parser(query).parse()
+
+
+class QueryAnalysis:
+    """
+    The outcome of analyzing a query before it runs: its algebra tree, the
+    issues found (dicts with kind, severity and message) and a rough cost
+    class, one of COST_CLASSES or "unknown" if the query could not be parsed.
+    """
+
+    def __init__(self, query: str, tree: Query | None = None, parse_error: str | None = None):
+        self.query = query
+        self.tree = tree
+        self.parse_error = parse_error
+        self.issues = []
+
+    def add(self, kind: str, severity: str, message: str):
+        self.issues.append({"kind": kind, "severity": severity, "message": message})
+
+    @property
+    def missing_limit(self) -> bool:
+        return any(issue["kind"] == "missing_limit" for issue in self.issues)
+
+    @property
+    def cost(self) -> str:
+        if self.tree is None:
+            return "unknown"
+        points = sum(SEVERITY_POINTS.get(issue["severity"], 0) for issue in self.issues)
+        if points >= 6:
+            return "extreme"
+        if points >= 3:
+            return "high"
+        return "medium" if points else "low"
+
+
+def walk_groups(group: Group):
+    """
+    Yields every group in a pattern, the given one first, including the
+    groups of subqueries and of EXISTS filters.
+    """
+    yield group
+    for element in group.elements:
+        if isinstance(element, Group):
+            yield from walk_groups(element)
+        elif isinstance(element, (Optional, Graph)):
+            yield from walk_groups(element.group)
+        elif isinstance(element, Union):
+            for child in element.groups:
+                yield from walk_groups(child)
+        elif isinstance(element, Filter):
+            for child in element.groups:
+                yield from walk_groups(child)
+        elif isinstance(element, Query) and element.where is not None:
+            yield from walk_groups(element.where)
+
+
+def _is_anchored(triple: Triple) -> bool:
+    return triple.subject[0] == "const" or triple.object[0] == "const"
+
+
+def _components(group: Group) -> list:
+    """
+    Splits the joined elements of a group (triples, nested patterns,
+    optionals, subqueries and VALUES) into sets of variables that are
+    connected through shared variables. FILTER, BIND and MINUS only extend
+    or restrict the solutions they follow, and elements without variables
+    match at most once, so those are left out.
+    """
+    components = []
+    for element in group.elements:
+        if isinstance(element, (Filter, Minus)) or type(element) is Bind:
+            continue
+        variables = element.variables()
+        if not variables:
+            continue
+        joined = [component for component in components if component & variables]
+        for component in joined:
+            components.remove(component)
+            variables |= component
+        components.append(variables)
+    return components
+
+
+def _show(variables: set) -> str:
+    names = sorted(name for name in variables if not name.startswith("_:"))
+    return ", ".join(names[:4]) + (", …" if len(names) > 4 else "") if names else "blank nodes"
+
+
+def analyze_query(query: str) -> QueryAnalysis:
+    """
+    Statically checks a query for the patterns that make public endpoints
+    run until they time out: triple patterns with nothing bound, patterns
+    sharing no variable (a cartesian product), no constant to start from,
+    string filters evaluated row by row, and results without a LIMIT.
+    """
+    try:
+        tree = parse_query(query)
+    except QueryParseError as e:
+        return QueryAnalysis(query, parse_error=str(e))
+    analysis = QueryAnalysis(query, tree)
+    if tree.where is None:
+        return analysis
+
+    groups = list(walk_groups(tree.where))
+    triples = [element for group in groups for element in group.elements if isinstance(element, Triple)]
+    anchored = any(_is_anchored(triple) for triple in triples) or \
+        any(isinstance(element, Values) for group in groups for element in group.elements)
+
+    for triple in triples:
+        if triple.subject[0] == "var" and triple.predicate[0] == "var" and triple.object[0] == "var":
+            analysis.add("unanchored", "high",
+                         f"The pattern {triple.subject[1]} {triple.predicate[1]} {triple.object[1]} "
+                         "has nothing bound and matches every triple in the dataset.")
+        elif triple.predicate[0] == "path" and any(modifier in triple.predicate[1] for modifier in "*+") \
+                and not _is_anchored(triple):
+            analysis.add("unanchored", "high",
+                         f"The path {triple.predicate[1]} is repeated with * or + between two unbound ends, "
+                         "so the endpoint has to follow it from every node.")
+    if triples and not anchored:
+        analysis.add("unanchored", "medium",
+                     "No triple pattern has a constant subject or object, so every pattern starts "
+                     "from all the triples with its predicate.")
+
+    for group in groups:
+        components = _components(group)
+        if len(components) > 1:
+            parts = " and ".join("{" + _show(component) + "}" for component in components)
+            analysis.add("disconnected", "high",
+                         f"The patterns over {parts} share no variable, so the result is every "
+                         "combination of their matches (a cartesian product).")
+
+        for element in group.elements:
+            if not isinstance(element, Filter):
+                continue
+            expensive = [name for name in dict.fromkeys(element.functions) if name in _EXPENSIVE_FUNCTIONS]
+            if expensive:
+                on = _show(set(element.mentioned()))
+                analysis.add("expensive_filter", "medium" if anchored else "high",
+                             f"FILTER with {', '.join(expensive)} on {on} is evaluated row by row and "
+                             "cannot use an index" + ("." if anchored else ", over every match in the dataset."))
+            if element.groups:
+                analysis.add("expensive_filter", "medium",
+                             "FILTER EXISTS / NOT EXISTS runs its pattern once per solution.")
+
+    aggregate_only = bool(tree.aggregates) and not tree.group_by
+    if tree.form in ("SELECT", "CONSTRUCT", "DESCRIBE") and tree.limit is None and not aggregate_only:
+        analysis.add("missing_limit", "medium",
+                     "The query has no LIMIT, so it returns every match the endpoint finds.")
+    return analysis
+
+
+def add_limit(query: str, limit: int, analysis: QueryAnalysis | None = None) -> str:
+    """
+    Adds a LIMIT to the outer query, after its other solution modifiers and
+    before a trailing VALUES block.
+    """
+    analysis = analysis or analyze_query(query)
+    if analysis.tree is None or analysis.tree.limit is not None:
+        return query
+    end = analysis.tree.modifiers_end
+    rest = query[end:].strip()
+    return query[:end].rstrip() + f"\nLIMIT {limit}\n" + (rest + "\n" if rest else "")
+
+
+def guard_query(query: str, mode: str = "warn", safe_limit: int = 1000,
+                bounded: bool = False) -> tuple[str, QueryAnalysis, str | None]:
+    """
+    Analyzes a query and applies the guard mode: "warn" only reports,
+    "limit" also adds LIMIT `safe_limit` to an unbounded query, and "block"
+    does that too and refuses queries whose cost is still high or extreme.
+    `bounded` means the caller caps the rows itself (e.g. paged execution),
+    so no LIMIT is added. Returns the query to run, the analysis of that
+    query and the reason for refusing it, or None.
+    """
+    if mode not in GUARD_MODES:
+        raise ValueError(f"Unknown guard mode: {mode}")
+    analysis = analyze_query(query)
+    if mode in ("off", "warn"):
+        return query, analysis, None
+
+    if analysis.missing_limit and not bounded:
+        query = add_limit(query, safe_limit, analysis)
+        analysis = analyze_query(query)
+    if mode == "block" and analysis.cost in ("high", "extreme"):
+        return query, analysis, f"Query refused before sending: its estimated cost is {analysis.cost}."
+    return query, analysis, None
@@ -0,0 +1,383 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "sparql_results.sqlite")
+DEFAULT_LLM_CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a SPARQL query for use in a cache key: comments are dropped
+    and runs of whitespace collapse to a single space, except inside
+    string literals and IRIs where every character is significant.
+    """
+    out = []
+    pending_space = False
+    i, n = 0, len(query)
+    while i < n:
+        ch = query[i]
+        if ch in "\"'":
+            end = _skip_string(query, i)
+        elif ch == "<" and _looks_like_iri(query, i):
+            end = query.find(">", i) + 1
+        elif ch == "#":
+            newline = query.find("\n", i)
+            i = n if newline == -1 else newline
+            pending_space = True
+            continue
+        elif ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+        else:
+            end = i + 1
+
+        if pending_space and out:
+            out.append(" ")
+        pending_space = False
+        out.append(query[i:end])
+        i = end
+    return "".join(out)
+
+
+def _skip_string(text: str, start: int) -> int:
+    """
+    Returns the index just past the string literal that starts at `start`.
+    """
+    quote = text[start]
+    if text.startswith(quote * 3, start):
+        end = text.find(quote * 3, start + 3)
+        return len(text) if end == -1 else end + 3
+    i = start + 1
+    while i < len(text):
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text[i] == quote or text[i] == "\n":
+            return i + 1
+        i += 1
+    return len(text)
+
+
+def _looks_like_iri(text: str, start: int) -> bool:
+    """
+    Tells an IRI reference apart from the `<` comparison operator.
+    """
+    end = text.find(">", start)
+    if end == -1:
+        return False
+    body = text[start + 1:end]
+    return not any(c.isspace() or c in "<\"{}|^`" for c in body)
+
+
+class _SQLiteLRUCache:
+    """
+    An in-memory LRU in front of a SQLite table, shared by the caches below.
+    Each row holds a key, a group (such as the endpoint a result came from),
+    its expiry and last access times, its size and the encoded value. Both
+    levels are trimmed to a byte-size cap, the disk by least recent access.
+    Subclasses name the table and its columns and encode the values.
+    """
+
+    table = ""
+    group_column = ""
+    payload_column = ""
+    payload_type = "BLOB"
+
+    def __init__(self, path: str, max_bytes: int, memory_max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                {self.group_column} TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                {self.payload_column} {self.payload_type} NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_{self.group_column} ON {self.table} ({self.group_column})"
+        )
+        self._db.commit()
+
+    def _encode(self, value) -> bytes | str:
+        raise NotImplementedError
+
+    def _decode(self, payload: bytes | str):
+        raise NotImplementedError
+
+    @staticmethod
+    def _payload_size(payload: bytes | str) -> int:
+        return len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+
+    def _get(self, key: str):
+        """
+        Returns the value stored under a key, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value, _ = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return value
+                self._drop_memory(key)
+
+            row = self._db.execute(
+                f"SELECT expires_at, size, {self.payload_column} FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            expires_at, size, payload = row
+            if expires_at <= now:
+                self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+
+            self._db.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            value = self._decode(payload)
+            self._remember(key, expires_at, value, size)
+            return value
+
+    def _set(self, key: str, group: str, value, ttl: float):
+        """
+        Stores a value for `ttl` seconds. Values larger than the cache itself are skipped.
+        """
+        payload = self._encode(value)
+        size = self._payload_size(payload)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)",
+                (key, group, expires_at, now, size, payload),
+            )
+            self._evict_disk()
+            self._db.commit()
+            self._remember(key, expires_at, value, size)
+
+    def _delete(self, key: str | None = None, group: str | None = None) -> int:
+        """
+        Removes one key, every key of a group, or with neither, everything.
+        Returns how many entries were dropped.
+        """
+        with self._lock:
+            if key is not None:
+                self._drop_memory(key)
+                removed = self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount
+            elif group is not None:
+                keys = [k for (k,) in self._db.execute(
+                    f"SELECT key FROM {self.table} WHERE {self.group_column} = ?", (group,))]
+                for k in keys:
+                    self._drop_memory(k)
+                removed = self._db.execute(
+                    f"DELETE FROM {self.table} WHERE {self.group_column} = ?", (group,)).rowcount
+            else:
+                self._memory.clear()
+                self._memory_bytes = 0
+                removed = self._db.execute(f"DELETE FROM {self.table}").rowcount
+            self._db.commit()
+            return removed
+
+    def purge_expired(self) -> int:
+        """
+        Deletes every expired entry from both cache levels.
+        """
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (expires_at, _, _) in self._memory.items() if expires_at <= now]:
+                self._drop_memory(key)
+            removed = self._db.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)).rowcount
+            self._db.commit()
+            return removed
+
+    def _disk_usage(self) -> tuple[int, int]:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+
+    def _remember(self, key: str, expires_at: float, value, size: int):
+        if size > self.memory_max_bytes:
+            return
+        self._drop_memory(key)
+        self._memory[key] = (expires_at, value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (_, _, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _drop_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[2]
+
+    def _evict_disk(self):
+        total = self._db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._db.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+        total = self._db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        for key, size in self._db.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._drop_memory(key)
+            total -= size
+
+
+class ResultCache(_SQLiteLRUCache):
+    """
+    Caches SPARQL query results as DataFrames. Entries live in an in-memory
+    LRU in front of a SQLite store on disk, so they survive reruns, sessions
+    and restarts. Each entry expires after the TTL configured for its
+    endpoint, and both levels are trimmed to a byte-size cap.
+    """
+
+    table = "results"
+    group_column = "endpoint"
+    payload_column = "payload"
+    payload_type = "BLOB"
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 256 * 1024 * 1024,
+                 memory_max_bytes: int = 64 * 1024 * 1024, default_ttl: float = 3600,
+                 endpoint_ttls: dict | None = None):
+        super().__init__(path, max_bytes, memory_max_bytes)
+        self.default_ttl = default_ttl
+        self.endpoint_ttls = endpoint_ttls or {}
+
+    @staticmethod
+    def make_key(query: str, endpoint: str, result_format: str = "json") -> str:
+        """
+        Builds the cache key for a (query, endpoint, result format) triple.
+        """
+        raw = "\x1f".join([normalize_query(query), endpoint.strip(), result_format.lower()])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, endpoint: str) -> float:
+        """
+        Returns the time-to-live in seconds for results from an endpoint.
+        """
+        return self.endpoint_ttls.get(endpoint, self.default_ttl)
+
+    def _encode(self, df: pd.DataFrame) -> bytes:
+        return pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, payload: bytes) -> pd.DataFrame:
+        return pickle.loads(payload)
+
+    def get(self, query: str, endpoint: str, result_format: str = "json") -> pd.DataFrame | None:
+        """
+        Returns the cached DataFrame for a query, or None on a miss.
+        """
+        df = self._get(self.make_key(query, endpoint, result_format))
+        # Callers get their own copy, so changing it doesn't change the cache
+        return df.copy() if df is not None else None
+
+    def set(self, query: str, endpoint: str, df: pd.DataFrame, result_format: str = "json"):
+        """
+        Stores a query result. Results larger than the cache itself are skipped.
+        """
+        self._set(self.make_key(query, endpoint, result_format), endpoint, df.copy(), self.ttl_for(endpoint))
+
+    def invalidate(self, query: str | None = None, endpoint: str | None = None,
+                   result_format: str = "json") -> int:
+        """
+        Removes cached results and returns how many entries were dropped.
+        With a query and endpoint only that result is removed, with just an
+        endpoint every result from it is removed, and with neither the whole
+        cache is cleared.
+        """
+        if query is not None:
+            if endpoint is None:
+                raise ValueError("An endpoint is required to invalidate a single query.")
+            return self._delete(key=self.make_key(query, endpoint, result_format))
+        return self._delete(group=endpoint)
+
+
+class LLMResponseCache(_SQLiteLRUCache):
+    """
+    Caches LLM responses by the content of the request: the provider, the
+    model, the messages (with runs of whitespace collapsed) and the other
+    parameters. Like ResultCache, entries live in an in-memory LRU in front
+    of a SQLite store, expire after a TTL and are trimmed to a byte-size cap.
+    Hits and misses are counted per process.
+    """
+
+    table = "responses"
+    group_column = "provider"
+    payload_column = "response"
+    payload_type = "TEXT"
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, max_bytes: int = 32 * 1024 * 1024,
+                 memory_max_bytes: int = 8 * 1024 * 1024, ttl: float = 7 * 24 * 3600):
+        super().__init__(path, max_bytes, memory_max_bytes)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(provider: str, model: str, messages: list | str, params: dict | None = None) -> str:
+        """
+        Builds the cache key for a request. A plain prompt string counts as a single user message.
+        """
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        normalized = [[message["role"], " ".join(message["content"].split())] for message in messages]
+        raw = json.dumps([provider, model, normalized, params or {}], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _encode(self, response: str) -> str:
+        return response
+
+    def _decode(self, payload: str) -> str:
+        return payload
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the cached response for a key, or None on a miss.
+        """
+        response = self._get(key)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def set(self, key: str, response: str, provider: str = ""):
+        """
+        Stores a response. Responses larger than the cache itself are skipped.
+        """
+        self._set(key, provider, response, self.ttl)
+
+    def clear(self) -> int:
+        return self._delete()
+
+    def stats(self) -> dict:
+        entries, size = self._disk_usage()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
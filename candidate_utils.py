@@ -0,0 +1,117 @@
+import time
+from functools import partial
+from typing import Callable
+
+from analysis_utils import COST_CLASSES, analyze_query, add_limit
+from cache_utils import normalize_query
+from job_utils import fan_out
+from sparql_utils import count_triples, run_sparql_query, split_limit_offset
+
+# Best first: queries returning rows, then those returning nothing, then failures
+STATUS_ORDER = ("rows", "empty", "error", "invalid", "no_query")
+
+
+def generate_candidates(generate: Callable[[int], str], k: int = 3, max_workers: int = 4,
+                        timeout: float = 60) -> list:
+    """
+    Calls `generate(i)` for i in range(k) concurrently and returns the
+    replies that arrived within `timeout` seconds, in the order of i.
+    A call that fails or times out is left out rather than failing the rest.
+    """
+    replies, _ = fan_out({i: partial(generate, i) for i in range(k)}, max_workers=max_workers, timeout=timeout)
+    return [replies[i] for i in sorted(replies) if replies[i]]
+
+
+def limit_for_dry_run(query: str, limit: int, analysis=None) -> str:
+    """
+    Returns the query with its LIMIT lowered to `limit`, or added if it has
+    none, so a dry run only asks the endpoint for a few rows. ASK queries
+    and queries that could not be parsed are returned as they are.
+    """
+    analysis = analysis or analyze_query(query)
+    tree = analysis.tree
+    if tree is None or tree.form not in ("SELECT", "CONSTRUCT", "DESCRIBE"):
+        return query
+    if tree.limit is None:
+        return add_limit(query, limit, analysis)
+    if tree.limit <= limit:
+        return query
+    base, current, offset = split_limit_offset(query)
+    if current is None:
+        # The LIMIT is not at the end (e.g. followed by VALUES); keep the query's own
+        return query
+    return f"{base}\nLIMIT {limit}" + (f" OFFSET {offset}" if offset else "")
+
+
+def dry_run(query: str, endpoint: str, limit: int = 5, timeout: float = 10,
+            result_format: str = "json") -> dict:
+    """
+    Parses a query and runs it with a small LIMIT and a short timeout.
+    Returns a dict with the query, its status (one of STATUS_ORDER), the
+    row count, the estimated cost class, the elapsed seconds and the error
+    message, if any. An ASK query counts as empty when it answers false,
+    and for CONSTRUCT and DESCRIBE the rows are the triples returned.
+    """
+    result = {"query": query, "status": "invalid", "rows": 0, "cost": "unknown",
+              "elapsed": None, "error": None}
+    analysis = analyze_query(query)
+    result["cost"] = analysis.cost
+    if analysis.parse_error:
+        result["error"] = analysis.parse_error
+        return result
+
+    started = time.perf_counter()
+    form = analysis.tree.form if analysis.tree is not None else None
+    try:
+        if form in ("CONSTRUCT", "DESCRIBE"):
+            rows = count_triples(limit_for_dry_run(query, limit, analysis), endpoint, timeout=timeout)
+        else:
+            df = run_sparql_query(limit_for_dry_run(query, limit, analysis), endpoint, result_format, timeout=timeout)
+            # An ASK comes back as a single "boolean" row, true or false
+            rows = int(bool(df["boolean"].iloc[0])) if form == "ASK" and "boolean" in df else len(df)
+    except Exception as e:
+        result["status"], result["error"] = "error", str(e) or type(e).__name__
+    else:
+        result["rows"] = rows
+        result["status"] = "rows" if rows else "empty"
+    result["elapsed"] = time.perf_counter() - started
+    return result
+
+
+def _rank_key(result: dict) -> tuple:
+    cost = COST_CLASSES.index(result["cost"]) if result["cost"] in COST_CLASSES else len(COST_CLASSES)
+    return STATUS_ORDER.index(result["status"]), cost, result["elapsed"] or 0.0
+
+
+def rank_candidates(candidates: list, endpoint: str, limit: int = 5, timeout: float = 10,
+                    max_workers: int = 4, result_format: str = "json") -> list:
+    """
+    Dry-runs candidate queries concurrently against an endpoint and returns
+    one result per candidate, best first: queries returning rows before
+    empty ones, failures last, then by estimated cost and speed.
+
+    `candidates` are (reply, query) pairs, the query being None when the
+    reply had none. Each result is the dry_run dict plus the reply. Copies
+    of the same query are run once, and the whole round is bounded by
+    about `timeout` seconds, whatever the number of candidates.
+    """
+    results = []
+    runs = {}
+    for reply, query in candidates:
+        if not query:
+            results.append({"reply": reply, "query": None, "status": "no_query", "rows": 0,
+                            "cost": "unknown", "elapsed": None, "error": None})
+        else:
+            runs.setdefault(normalize_query(query), []).append((reply, query))
+
+    outcomes, errors = fan_out(
+        {key: partial(dry_run, copies[0][1], endpoint, limit, timeout, result_format) for key, copies in runs.items()},
+        max_workers=max_workers, timeout=timeout + 1,
+    )
+    for key, copies in runs.items():
+        outcome = outcomes.get(key) or {"query": copies[0][1], "status": "error", "rows": 0, "cost": "unknown",
+                                        "elapsed": None, "error": str(errors[key]) or type(errors[key]).__name__}
+        results += [{**outcome, "reply": reply, "query": query} for reply, query in copies]
+
+    results.sort(key=_rank_key)
+    return results
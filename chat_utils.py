@@ -1,14 +1,24 @@
-import google.generativeai as genai
-import re
+from typing import Iterator
+
+from llm_utils import stream_gemini
+from query_utils import extract_query
 
 class ChatManager:
     """
     A simple class to manage chat messages and interact with the Gemini model.
     """
 
-    def __init__(self, model_name: str = "gemini-1.5-flash"):
+    def __init__(self, model_name: str = "gemini-1.5-flash", model=None, cache=None):
+        """
+        Uses `model` if given, so a GenerativeModel can be shared between managers.
+        Responses are served from `cache` (a cache_utils.LLMResponseCache) when given.
+        """
         self.messages = []
-        self.model = genai.GenerativeModel(model_name)
+        self.cache = cache
+        if model is None:
+            import google.generativeai as genai
+            model = genai.GenerativeModel(model_name)
+        self.model = model
 
     def add_user_message(self, message: str):
         """
@@ -26,8 +36,22 @@ class ChatManager:
         """
         Uses the configured model to generate content.
         """
-        response = self.model.generate_content(prompt)
-        return response.text
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key("gemini", self.model.model_name, prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        text = self.model.generate_content(prompt).text
+        if key is not None:
+            self.cache.set(key, text, provider="gemini")
+        return text
+
+    def stream_response(self, prompt: str) -> Iterator[str]:
+        """
+        Like generate_response, but yields the text as the model produces it.
+        """
+        return stream_gemini(self.model, prompt, cache=self.cache)
 
     def get_conversation(self):
         """
@@ -37,20 +61,12 @@ class ChatManager:
 
     def extract_sparql_query(self, text: str) -> str:
         """
-        Attempt to extract only the SPARQL query from a chunk of text,
-        ignoring any explanations or extra commentary. 
-        1) Prefer a fenced code block with ```sparql ...
-        2) Fallback: find the first mention of SELECT, ASK, or CONSTRUCT
-           and capture until the end of the text.
+        Extracts the first SPARQL query from a chunk of text, ignoring any
+        explanations or extra commentary, with the PREFIX declarations before
+        it. Uses the same scanner as the chat (query_utils.extract_query),
+        preferring a ```sparql code block.
         """
-        code_blocks = re.findall(r"```(?:sparql)?(.*?)```", text, re.DOTALL | re.IGNORECASE)
-        if code_blocks:
-            return code_blocks[0].strip()
-
-        match = re.search(r"(?i)(SELECT|ASK|CONSTRUCT)\s.*", text, re.DOTALL)
-        if match:
-            raw_query = match.group(0)
-            raw_query = re.sub(r"```+", "", raw_query)
-            return raw_query.strip()
-
-        return ""
+        query, prefixes = extract_query(text)
+        if query is None:
+            return ""
+        return f"{prefixes}\n{query}" if prefixes else query
@@ -0,0 +1,141 @@
+import re
+
+from ontology_utils import CLASS, DATATYPE_PROPERTY, OBJECT_PROPERTY, OntologyIndex
+from prefix_utils import known_prefixes
+from query_utils import tokenize
+
+_TYPE_TRIPLE = re.compile(r"(?:(?<![?$\w])a|rdf:type|<http://www\.w3\.org/1999/02/22-rdf-syntax-ns#type>)\s+"
+                          r"(<[^>\s]+>|[\w.-]*:[\w.-]+)")
+_TRAILING_TERM = re.compile(r"(?<![\w.:<?$-])([A-Za-z][\w.-]*:?[\w.-]*|:[\w.-]*)$")
+
+_LOCAL_NAME = re.compile(r"[\w-]+(?:\.[\w-]+)*")
+
+_KIND_NAMES = {CLASS: "class", OBJECT_PROPERTY: "object property", DATATYPE_PROPERTY: "datatype property"}
+
+
+def _expand(term: str, prefixes: dict) -> str | None:
+    if term.startswith("<"):
+        return term[1:-1]
+    prefix, _, name = term.partition(":")
+    namespace = prefixes.get(prefix)
+    return namespace + name if namespace is not None else None
+
+
+def _compact(iri: str, prefixes: dict) -> str:
+    # Prefer the longest matching namespace, so dbp: doesn't shadow a more specific one
+    best = max((ns for ns in prefixes.values() if iri.startswith(ns)), key=len, default=None)
+    if best is None or not _LOCAL_NAME.fullmatch(iri[len(best):]):
+        return f"<{iri}>"
+    prefix = next(p for p, ns in prefixes.items() if ns == best)
+    return f"{prefix}:{iri[len(best):]}"
+
+
+def query_context(query: str, index: OntologyIndex) -> dict:
+    """
+    Collects what a query already uses: the classes its subjects are typed
+    with (plus their superclasses) and the ontology properties it mentions.
+    """
+    prefixes = known_prefixes(query)
+    classes = [iri for iri in (_expand(term, prefixes) for term in _TYPE_TRIPLE.findall(query))
+               if iri is not None and index.kind(iri) & CLASS]
+    ancestors = [ancestor for iri in classes for ancestor in index.ancestors(iri)]
+    terms = [term for kind, term, _ in tokenize(query) if kind in ("pname", "iri")]
+    properties = [iri for iri in (_expand(term, prefixes) for term in terms)
+                  if iri is not None and index.kind(iri) & (OBJECT_PROPERTY | DATATYPE_PROPERTY)]
+    return {
+        "prefixes": prefixes,
+        "classes": list(dict.fromkeys(classes)),
+        "ancestors": list(dict.fromkeys(a for a in ancestors if a not in classes)),
+        "properties": list(dict.fromkeys(properties)),
+    }
+
+
+def trailing_term(query: str) -> str:
+    """
+    Returns the partial name at the very end of the query, e.g. "dbo:birth",
+    or "" if the query ends with whitespace or punctuation.
+    """
+    match = _TRAILING_TERM.search(query)
+    return match.group(1) if match else ""
+
+
+def _score(iri: str, kind: int, index: OntologyIndex, context: dict) -> int:
+    """
+    Ranks a candidate by how well it fits the classes already in the query:
+    properties whose domain is one of those classes first, then properties
+    of their superclasses, then classes related to them or to the range of
+    a property in the query.
+    """
+    if kind & (OBJECT_PROPERTY | DATATYPE_PROPERTY):
+        domains = index.domain(iri)
+        if any(domain in context["classes"] for domain in domains):
+            return 3
+        if any(domain in context["ancestors"] for domain in domains):
+            return 2
+        return 0
+    if kind & CLASS:
+        ranges = {range_ for prop in context["properties"] for range_ in index.range(prop)}
+        if iri in ranges:
+            return 2
+        if any(parent in context["classes"] for parent in index.parents(iri)):
+            return 1
+    return 0
+
+
+def complete(index: OntologyIndex, text: str, query: str = "", limit: int = 10, lang: str = "en") -> list:
+    """
+    Suggests classes, properties and prefixes for a partial name such as
+    "dbo:birth", "birth" or "db", ranked by how well they fit the query.
+    With no name to match (e.g. "" or "dbo:") it suggests the properties
+    whose domain is one of the classes in the query.
+
+    Returns dicts with the term to insert (prefixed where possible), its
+    label, its kind and its full IRI.
+    """
+    context = query_context(query, index)
+    prefixes = context["prefixes"]
+    suggestions = []
+
+    prefix, colon, name = text.rpartition(":") if ":" in text else ("", "", text)
+    namespace = prefixes.get(prefix) if colon else None
+    if colon and namespace is None:
+        return []
+
+    if not colon and text:
+        suggestions += [
+            {"term": f"{p}:", "label": ns, "kind": "prefix", "iri": ns, "score": 1}
+            for p, ns in sorted(prefixes.items()) if p.startswith(text)
+        ]
+
+    if name:
+        # Over-fetch so reranking by context has something to choose from
+        candidates = [iri for _, iri in index.search(name, lang, kinds=CLASS | OBJECT_PROPERTY | DATATYPE_PROPERTY,
+                                                       limit=limit * 10)]
+    else:
+        candidates = [prop for cls in context["classes"] + context["ancestors"]
+                      for prop in index.properties_with_domain(cls)]
+    if namespace is not None:
+        candidates = [iri for iri in candidates if iri.startswith(namespace)]
+    candidates = list(dict.fromkeys(candidates))
+    if not name:
+        # Already in score order: properties of the query's classes, then of their superclasses
+        candidates = candidates[:limit]
+
+    for iri in candidates:
+        kind = index.kind(iri)
+        kind = next((k for k in _KIND_NAMES if kind & k), None)
+        if kind is None:
+            continue
+        suggestions.append({
+            "term": _compact(iri, prefixes),
+            "label": index.label(iri),
+            "kind": _KIND_NAMES[kind],
+            "iri": iri,
+            "score": _score(iri, kind, index, context),
+        })
+
+    # Stable sort keeps the index's alphabetical order within each score
+    suggestions.sort(key=lambda suggestion: -suggestion["score"])
+    for suggestion in suggestions:
+        del suggestion["score"]
+    return suggestions[:limit]
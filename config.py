@@ -1,12 +1,89 @@
 import os
-import google.generativeai as genai
-import openai
 import streamlit as st
 
+# Result cache settings (see cache_utils.ResultCache)
+RESULT_CACHE_PATH = ".cache/sparql_results.sqlite"
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RESULT_CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_DEFAULT_TTL = 60 * 60  # seconds
+RESULT_CACHE_ENDPOINT_TTLS = {
+    "https://dbpedia.org/sparql": 24 * 60 * 60,
+    "https://query.wikidata.org/sparql": 15 * 60,
+}
+
+# LLM response cache settings (see cache_utils.LLMResponseCache)
+LLM_CACHE_PATH = ".cache/llm_responses.sqlite"
+LLM_CACHE_MAX_BYTES = 32 * 1024 * 1024
+LLM_CACHE_MEMORY_BYTES = 8 * 1024 * 1024
+LLM_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+
+# Semantic cache of chat questions and the queries that answered them (see semantic_utils.SemanticQueryCache)
+SEMANTIC_CACHE_PATH = ".cache/semantic_queries.sqlite"
+SEMANTIC_MATCH_THRESHOLD = 0.75  # cosine similarity of hashed character n-grams
+
+# Preferred SPARQL result format: "json", "tsv" or "csv".
+# TSV keeps term types and is cheaper to parse; CSV drops datatypes and language tags.
+SPARQL_RESULT_FORMAT = "json"
+
+# Shared HTTP transport settings (see http_utils.SPARQLTransport)
+HTTP_CONNECT_TIMEOUT = 5  # seconds
+HTTP_READ_TIMEOUT = 120  # seconds
+HTTP_MAX_RESPONSE_BYTES = 200 * 1024 * 1024
+HTTP_POOL_HOSTS = 20
+HTTP_POOL_SIZE = 8
+
+# Background query execution (see job_utils.QueryJobRunner)
+QUERY_TIMEOUT = 120  # seconds, hard limit per query
+QUERY_JOB_WORKERS = 8
+
+# Paged execution settings (see sparql_utils.iter_query_pages)
+QUERY_PAGE_SIZE = 1000
+QUERY_MAX_ROWS = 100_000
+QUERY_PAGE_WORKERS = 2
+
+# Federated query settings (see federation_utils.run_federated_query)
+FEDERATION_MAX_WORKERS = 8
+FEDERATION_TIMEOUT = 30  # seconds, for the whole fan-out
+
+# Endpoint health prober settings (see health_utils.EndpointProber)
+HEALTH_PROBE_INTERVAL = 120  # seconds between probe rounds
+HEALTH_PROBE_TIMEOUT = 10  # seconds
+HEALTH_PROBE_WINDOW = 20  # probes kept per endpoint
+
+# Pre-flight query analysis (see analysis_utils.guard_query): "off", "warn", "limit" adds
+# SAFE_LIMIT to unbounded queries, "block" also refuses queries estimated as high cost
+SPARQL_GUARD_MODE = "warn"
+SAFE_LIMIT = 1000
+
+# Rows per page in the result tables (see table_utils.ResultView)
+RESULT_PAGE_SIZE = 200
+
+# Show the "Performance" expander with startup, rerun and cache timings (see perf_utils.TimingReport)
+SHOW_PERFORMANCE_PANEL = False
+
+# Chat messages shown at first; "Load older messages" shows this many more each time
+CHAT_WINDOW = 30
+
+# Candidate query generation, opt-in from the chat (see candidate_utils.rank_candidates)
+QUERY_CANDIDATES = 3  # replies requested at once
+CANDIDATE_TEMPERATURE = 0.9
+CANDIDATE_GENERATION_TIMEOUT = 60  # seconds, for all the replies
+CANDIDATE_DRY_RUN_LIMIT = 5
+CANDIDATE_DRY_RUN_TIMEOUT = 10  # seconds, for all the dry runs
+
+# Chat prompt budget (see context_utils.ConversationContext); older turns are folded into a summary
+CHAT_CONTEXT_BUDGET = 3000  # tokens
+CHAT_KEEP_TURNS = 4
+CHAT_SUMMARY_TOKENS = 300
+
+# Compiled ontology index (see ontology_utils.build_index), built from data/*.json and data/*.owl
+ONTOLOGY_INDEX_PATH = "data/ontology.idx"
+
 class AppConfig:
     def __init__(self):
         """
-        Loads environment variables from Streamlit secrets and configures the Gemini and OpenAI APIs.
+        Loads the API keys from Streamlit secrets. The Gemini and OpenAI clients are
+        imported and configured when first asked for, see gemini() and openai().
         """
         self.gemini_api_key = st.secrets.get("GEMINI_API_KEY")
         self.openai_api_key = st.secrets.get("OPENAI_API_KEY")
@@ -14,16 +91,27 @@ class AppConfig:
 
         self.api_key = st.secrets.get("GEMINI_API_KEY")
         self.default_sparql_endpoint = "https://dbpedia.org/sparql"  # Default SPARQL endpoint
+        self._gemini_configured = False
 
-        if self.gemini_api_key:
-            genai.configure(api_key=self.gemini_api_key)
-        else:
+        if not self.gemini_api_key:
             raise ValueError("Gemini API Key not found in Streamlit secrets.")
-
-        if self.openai_api_key:
-            openai.api_key = self.openai_api_key
-        else:
+        if not self.openai_api_key:
             raise ValueError("OpenAI API Key not found in Streamlit secrets.")
-        
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
\ No newline at end of file
+
+    def gemini(self):
+        """
+        Imports and configures the Gemini client on first use; the import takes about a second.
+        """
+        import google.generativeai as genai
+        if not self._gemini_configured:
+            genai.configure(api_key=self.gemini_api_key)
+            self._gemini_configured = True
+        return genai
+
+    def openai(self):
+        """
+        Imports the OpenAI client on first use and sets its API key.
+        """
+        import openai
+        openai.api_key = self.openai_api_key
+        return openai
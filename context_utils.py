@@ -0,0 +1,221 @@
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable
+
+from cache_utils import normalize_query
+from query_utils import fenced_block_pattern
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Without tiktoken, token counts are estimated at about four characters per token
+EXACT_TOKEN_COUNTS = tiktoken is not None
+
+_CODE_BLOCK = fenced_block_pattern()
+_CURRENT_QUERY_NOTE = "```\n# same as the current SPARQL query\n```"
+_REPEATED_QUERY_NOTE = "```\n# query repeated later in the conversation\n```"
+
+# Model-written summaries are produced off the request path, shared by all conversations
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: list, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Counts the prompt tokens of a chat request, including the few tokens of
+    framing the API adds around each message and before the reply.
+    """
+    return sum(4 + count_tokens(message["content"], model) for message in messages) + 3
+
+
+def drop_repeated_queries(messages: list, current_query: str = "") -> list:
+    """
+    Replaces code blocks that repeat the current query, or a block appearing
+    later in the conversation, with a one-line note. The latest copy of each
+    query is the one kept.
+    """
+    seen = {normalize_query(current_query)} if current_query.strip() else set()
+    current = set(seen)
+    deduplicated = []
+    for message in reversed(messages):
+        def replace(match):
+            key = normalize_query(match.group(2))
+            if not key:
+                return match.group(0)
+            if key in seen:
+                return _CURRENT_QUERY_NOTE if key in current else _REPEATED_QUERY_NOTE
+            seen.add(key)
+            return match.group(0)
+        deduplicated.append({"role": message["role"], "content": _CODE_BLOCK.sub(replace, message["content"])})
+    return deduplicated[::-1]
+
+
+def _turn_start(messages: list, turns: int) -> int:
+    """
+    Returns the index of the message starting the last `turns` turns, where
+    each user message starts a turn.
+    """
+    starts = [i for i, message in enumerate(messages) if message["role"] == "user"]
+    if len(starts) <= turns:
+        return 0
+    return starts[-turns]
+
+
+def _fingerprint(messages: list) -> str:
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message['role']}\x1f{message['content']}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _local_summary(previous: str, messages: list) -> str:
+    """
+    Summarizes without a model: the user's requests, one line each, and the
+    last query the assistant proposed.
+    """
+    lines = [previous] if previous else []
+    last_query = None
+    for message in messages:
+        if message["role"] == "user":
+            request = message["content"].strip().splitlines()[0] if message["content"].strip() else ""
+            lines.append(f"- The user asked: {request[:200]}")
+        else:
+            blocks = _CODE_BLOCK.findall(message["content"])
+            if blocks:
+                last_query = blocks[-1][1].strip()
+    if last_query:
+        lines.append(f"- The assistant last proposed:\n```sparql\n{last_query}\n```")
+    return "\n".join(lines)
+
+
+class ConversationContext:
+    """
+    Builds chat prompts within a token budget. The last `keep_turns` turns
+    are sent as they are, older turns are folded into a rolling summary that
+    is only extended when turns leave the window, and repeated copies of a
+    query are dropped. With a `summarize` function the summary is written by
+    a model on a background thread; until it is ready, the turns it will
+    cover are summarized locally, so building a prompt never waits on a
+    model call. The token counts of the last `max_stats` prompts built are
+    recorded in `stats`, next to what the full history would have cost.
+    """
+
+    def __init__(self, summarize: Callable[[str, str], str] | None = None, budget: int = 3000,
+                 keep_turns: int = 4, summary_tokens: int = 300, model: str = "gpt-3.5-turbo",
+                 max_stats: int = 50):
+        self.summarize = summarize
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.model = model
+        self.summary = ""
+        self.stats = deque(maxlen=max_stats)
+        self._summarized = 0
+        self._summarized_fingerprint = _fingerprint([])
+        self._pending = None
+
+    def _collect(self, messages: list):
+        """
+        Drops the summary if the history it covers has changed, and adopts a
+        background summary that has finished, if its history is still there.
+        """
+        if self._summarized > len(messages) or _fingerprint(messages[:self._summarized]) != self._summarized_fingerprint:
+            self.summary, self._summarized, self._summarized_fingerprint = "", 0, _fingerprint([])
+            self._pending = None
+        if self._pending is None or not self._pending[0].done():
+            return
+
+        future, upto, fingerprint = self._pending
+        self._pending = None
+        if upto > len(messages) or _fingerprint(messages[:upto]) != fingerprint:
+            return
+        try:
+            summary = future.result()
+        except Exception:
+            summary = None
+        if not summary:
+            summary = _local_summary(self.summary, messages[self._summarized:upto])
+        self.summary = self._truncate(summary.strip())
+        self._summarized = upto
+        self._summarized_fingerprint = fingerprint
+
+    def _summary_upto(self, messages: list, upto: int) -> str:
+        """
+        Returns the summary to send for messages[:upto]. Turns not yet in the
+        rolling summary are added locally; without a `summarize` function
+        that is final, otherwise the model's summary replaces it once ready.
+        """
+        if upto <= self._summarized:
+            return self.summary
+        summary = self._truncate(_local_summary(self.summary, messages[self._summarized:upto]).strip())
+        if self.summarize is None:
+            self.summary = summary
+            self._summarized = upto
+            self._summarized_fingerprint = _fingerprint(messages[:upto])
+        return summary
+
+    def _start_summary(self, messages: list, upto: int):
+        if self.summarize is None or self._pending is not None or upto <= self._summarized:
+            return
+        new = messages[self._summarized:upto]
+        transcript = "\n\n".join(f"{message['role']}: {message['content']}" for message in new)
+        future = _summary_executor.submit(self.summarize, self.summary, transcript)
+        self._pending = (future, upto, _fingerprint(messages[:upto]))
+
+    def _truncate(self, text: str) -> str:
+        if count_tokens(text, self.model) <= self.summary_tokens:
+            return text
+        # Keep the most recent part of the summary
+        keep = len(text) * self.summary_tokens // max(count_tokens(text, self.model), 1)
+        return "…" + text[-keep:]
+
+    def build(self, messages: list, system: list | None = None, current_query: str = "") -> list:
+        """
+        Returns the messages to send for a conversation ending in the user's
+        latest message, preceded by the `system` messages.
+        """
+        system = list(system or [])
+        history = [{"role": message["role"], "content": message["content"]} for message in messages]
+        self._collect(history)
+        keep = self.keep_turns
+        while True:
+            # Turns folded into the summary earlier stay folded
+            start = max(_turn_start(history, keep), self._summarized)
+            summary = self._summary_upto(history, start)
+            prompt = system[:]
+            if summary:
+                prompt.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+            prompt += drop_repeated_queries(history[start:], current_query)
+            tokens = count_message_tokens(prompt, self.model)
+            if tokens <= self.budget or keep <= 1:
+                break
+            keep -= 1
+        self._start_summary(history, start)
+
+        self.stats.append({
+            "prompt_tokens": tokens,
+            "history_tokens": count_message_tokens(system + history, self.model),
+            "summarized_messages": start,
+            "verbatim_messages": len(history) - start,
+        })
+        return prompt
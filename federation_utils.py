@@ -0,0 +1,63 @@
+import time
+from functools import partial
+
+import pandas as pd
+
+from job_utils import fan_out
+from sparql_utils import run_sparql_query, concat_frames
+
+SOURCE_COLUMN = "source_endpoint"
+
+
+def run_federated_query(queries: dict, max_workers: int = 8, timeout: float = 30,
+                        result_format: str = "json", cache=None, refresh: bool = False,
+                        **request_options) -> tuple[pd.DataFrame, dict]:
+    """
+    Runs queries against several endpoints concurrently and merges the results.
+
+    `queries` maps each endpoint to the query to send it, which may be the
+    same query for all of them. At most `max_workers` requests are in flight
+    at once and the whole fan-out is bounded by `timeout` seconds, so it takes
+    about as long as the slowest endpoint rather than the sum of all of them.
+    Endpoints that fail or time out are left out of the merged DataFrame
+    instead of failing the whole run. With a `cache`, results are read from
+    it and stored in it; `refresh` skips the read so every endpoint is
+    queried again.
+
+    Returns the merged DataFrame, with a "source_endpoint" column naming the
+    endpoint each row came from, and a report mapping every endpoint to its
+    row count, elapsed seconds, whether it was served from the cache and
+    error message (None on success).
+    Extra keyword arguments are passed on to run_sparql_query.
+    """
+    report = {endpoint: {"rows": 0, "elapsed": None, "cached": False, "error": None} for endpoint in queries}
+
+    def fetch(endpoint: str, query: str) -> pd.DataFrame:
+        started = time.perf_counter()
+        df = cache.get(query, endpoint, result_format) if cache is not None and not refresh else None
+        report[endpoint]["cached"] = df is not None
+        if df is None:
+            df = run_sparql_query(query, endpoint, result_format, timeout=timeout, **request_options)
+            if cache is not None:
+                cache.set(query, endpoint, df, result_format)
+        report[endpoint]["elapsed"] = time.perf_counter() - started
+        return df
+
+    frames, errors = fan_out({endpoint: partial(fetch, endpoint, query) for endpoint, query in queries.items()},
+                             max_workers=max_workers, timeout=timeout)
+    for endpoint, error in errors.items():
+        report[endpoint]["error"] = str(error) or type(error).__name__
+
+    merged = []
+    for endpoint in queries:
+        df = frames.get(endpoint)
+        if df is None:
+            continue
+        report[endpoint]["rows"] = len(df)
+        merged.append(df.assign(**{SOURCE_COLUMN: endpoint}))
+
+    if not merged:
+        return pd.DataFrame(columns=[SOURCE_COLUMN]), report
+    df = concat_frames(merged)
+    df[SOURCE_COLUMN] = df[SOURCE_COLUMN].astype("category")
+    return df, report
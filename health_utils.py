@@ -0,0 +1,150 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sparql_utils import run_sparql_query
+
+PROBE_QUERY = "ASK { ?s ?p ?o }"
+
+
+def _percentile(values: list, q: float) -> float | None:
+    """
+    Nearest-rank percentile of a list of numbers (q between 0 and 100).
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class EndpointProber:
+    """
+    Periodically sends a cheap ASK query to every endpoint from a background
+    thread and keeps a rolling window of outcomes per endpoint. The stats
+    (p50/p95 latency of successful probes and the error rate) can be read
+    at any time to rank endpoints or pick a fallback for a failing one.
+    """
+
+    def __init__(self, endpoints: list, interval: float = 120, timeout: float = 10,
+                 window: int = 20, max_workers: int = 8):
+        self.endpoints = list(endpoints)
+        self.interval = interval
+        self.timeout = timeout
+        self.window = window
+        self.max_workers = max_workers
+        self._samples = {endpoint: deque(maxlen=window) for endpoint in self.endpoints}
+        self._last_error = {}
+        self._last_checked = {}
+        # Completed probe rounds, so readers can tell when the stats last changed as a whole
+        self.rounds = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts probing in a daemon thread. Calling it again is a no-op.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="endpoint-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self._stop.is_set():
+                list(executor.map(self.probe, self.endpoints))
+                with self._lock:
+                    self.rounds += 1
+                self._stop.wait(self.interval)
+
+    def probe(self, endpoint: str) -> float | None:
+        """
+        Probes one endpoint now and records the outcome.
+        Returns the latency in seconds, or None if the probe failed.
+        """
+        started = time.perf_counter()
+        try:
+            run_sparql_query(PROBE_QUERY, endpoint, timeout=self.timeout)
+            latency, error = time.perf_counter() - started, None
+        except Exception as e:
+            latency, error = None, str(e) or type(e).__name__
+
+        with self._lock:
+            self._samples.setdefault(endpoint, deque(maxlen=self.window)).append(latency)
+            self._last_checked[endpoint] = time.time()
+            if error is None:
+                self._last_error.pop(endpoint, None)
+            else:
+                self._last_error[endpoint] = error
+        return latency
+
+    def stats(self, endpoint: str) -> dict:
+        """
+        Returns the rolling health stats of an endpoint: number of samples,
+        p50/p95 latency in seconds, error rate, last probe time and last error.
+        """
+        with self._lock:
+            samples = list(self._samples.get(endpoint, ()))
+            last_checked = self._last_checked.get(endpoint)
+            last_error = self._last_error.get(endpoint)
+        latencies = [latency for latency in samples if latency is not None]
+        return {
+            "samples": len(samples),
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "error_rate": (len(samples) - len(latencies)) / len(samples) if samples else None,
+            "last_checked": last_checked,
+            "last_error": last_error,
+        }
+
+    def all_stats(self) -> dict:
+        return {endpoint: self.stats(endpoint) for endpoint in self.endpoints}
+
+    def _rank_key(self, endpoint: str) -> tuple:
+        stats = self.stats(endpoint)
+        if not stats["samples"]:
+            return (1, 0.0, math.inf)
+        if stats["error_rate"] >= 0.5:
+            return (2, stats["error_rate"], stats["p95"] or math.inf)
+        return (0, stats["error_rate"], stats["p95"] or math.inf)
+
+    def ranked_endpoints(self, endpoints: list | None = None) -> list:
+        """
+        Sorts endpoints healthiest first: mostly-working endpoints by error
+        rate and p95 latency, then endpoints not probed yet, then endpoints
+        failing at least half of their probes.
+        """
+        candidates = self.endpoints if endpoints is None else endpoints
+        return sorted(candidates, key=self._rank_key)
+
+    def pick_fallback(self, exclude=()) -> str | None:
+        """
+        Returns the healthiest endpoint not in `exclude` that has answered a recent probe.
+        """
+        for endpoint in self.ranked_endpoints():
+            if endpoint in exclude:
+                continue
+            if self._rank_key(endpoint)[0] == 0:
+                return endpoint
+        return None
+
+    def describe(self, endpoint: str) -> str:
+        """
+        Returns a one-line health summary for display next to an endpoint.
+        """
+        stats = self.stats(endpoint)
+        if not stats["samples"]:
+            return f"⚪ {endpoint}"
+        if stats["p50"] is None:
+            return f"🔴 {endpoint} — down"
+        status = "🟢" if stats["error_rate"] == 0 else "🟡" if stats["error_rate"] < 0.5 else "🔴"
+        return (f"{status} {endpoint} — p50 {stats['p50'] * 1000:.0f} ms, "
+                f"p95 {stats['p95'] * 1000:.0f} ms, {stats['error_rate']:.0%} errors")
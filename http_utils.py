@@ -0,0 +1,214 @@
+import socket
+import threading
+from typing import Callable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import Retry, make_headers
+
+ACCEPT_HEADERS = {
+    "json": "application/sparql-results+json, application/json;q=0.9",
+    "tsv": "text/tab-separated-values, application/sparql-results+json;q=0.8",
+    "csv": "text/csv, application/sparql-results+json;q=0.8",
+    # CONSTRUCT and DESCRIBE return RDF rather than a result table
+    "ntriples": "application/n-triples, text/plain;q=0.9, text/turtle;q=0.8",
+}
+
+# Queries longer than this are sent as a POST form instead of a GET
+MAX_GET_QUERY_LENGTH = 2000
+
+
+class ResponseTooLargeError(ValueError):
+    """
+    Raised when a response body grows past the transport's size cap.
+    """
+
+
+# The callback of the request the current thread is sending, if any (see SPARQLTransport.open_query)
+_watcher = threading.local()
+
+
+def _report_connection(connection):
+    on_connection = getattr(_watcher, "on_connection", None)
+    if on_connection is not None:
+        on_connection(connection)
+
+
+class _WatchedConnectionMixin:
+    def connect(self):
+        super().connect()
+        _report_connection(self)
+
+
+class _WatchedHTTPConnection(_WatchedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _WatchedHTTPSConnection(_WatchedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _WatchedPoolMixin:
+    def _get_conn(self, timeout=None):
+        connection = super()._get_conn(timeout)
+        # New connections are reported once connected, kept-alive ones right away
+        if getattr(connection, "sock", None) is not None:
+            _report_connection(connection)
+        return connection
+
+
+class _WatchedHTTPConnectionPool(_WatchedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _WatchedHTTPConnection
+
+
+class _WatchedHTTPSConnectionPool(_WatchedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _WatchedHTTPSConnection
+
+
+class _WatchedAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter whose pools report the connection each request is sent
+    on, so it can be aborted while the endpoint has not answered yet.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _WatchedHTTPConnectionPool,
+            "https": _WatchedHTTPSConnectionPool,
+        }
+
+
+class SPARQLTransport:
+    """
+    A shared HTTP transport for SPARQL endpoints. One requests.Session keeps
+    a keep-alive connection pool per endpoint host, so repeat queries to the
+    same host skip DNS, TCP and TLS setup. Responses are negotiated with
+    compression (gzip/deflate, plus br when a brotli package is installed),
+    every request gets connect and read timeouts, and bodies are capped at
+    `max_response_bytes`.
+    """
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 60,
+                 max_response_bytes: int = 200 * 1024 * 1024, pool_hosts: int = 20,
+                 pool_size: int = 8, retries: int = 2):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_response_bytes = max_response_bytes
+
+        # Only connection failures are retried: a read timeout means the
+        # endpoint is already working on the query and should not get it twice.
+        adapter = _WatchedAdapter(
+            pool_connections=pool_hosts,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=0.2),
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(make_headers(accept_encoding=True))
+        self.session.headers["User-Agent"] = "streamlit-sparql-ui"
+
+    def open_query(self, endpoint: str, query: str, result_format: str = "json",
+                   timeout: float | None = None,
+                   on_connection: Callable[[object], None] | None = None) -> requests.Response:
+        """
+        Sends a query using the SPARQL protocol and returns the streaming response.
+        Short queries go out as GET requests so HTTP caches in front of the
+        endpoint can answer them; longer ones are POSTed as a form.
+        `on_connection` receives the connection the request is sent on, so
+        another thread can abort it (see abort_connection) before the
+        response headers arrive, and None once they have.
+        """
+        headers = {"Accept": ACCEPT_HEADERS[result_format]}
+        timeouts = (self.connect_timeout, timeout or self.read_timeout)
+        _watcher.on_connection = on_connection
+        try:
+            if len(query) <= MAX_GET_QUERY_LENGTH:
+                response = self.session.get(endpoint, params={"query": query}, headers=headers,
+                                            timeout=timeouts, stream=True)
+            else:
+                response = self.session.post(endpoint, data={"query": query}, headers=headers,
+                                             timeout=timeouts, stream=True)
+        finally:
+            _watcher.on_connection = None
+            if on_connection is not None:
+                on_connection(None)
+
+        if response.status_code >= 400:
+            detail = response.text[:500].strip()
+            response.close()
+            raise requests.HTTPError(
+                f"{response.status_code} {response.reason} from {endpoint}" + (f": {detail}" if detail else ""),
+                response=response,
+            )
+        return response
+
+    def iter_chunks(self, response: requests.Response, chunk_size: int = 64 * 1024,
+                    on_chunk: Callable[[int], None] | None = None) -> Iterator[bytes]:
+        """
+        Yields the decompressed body of a response in chunks, enforcing the size cap.
+        `on_chunk` is called with the size of every chunk and may raise to stop the download.
+        """
+        received = 0
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            received += len(chunk)
+            if on_chunk is not None:
+                on_chunk(len(chunk))
+            if received > self.max_response_bytes:
+                response.close()
+                raise ResponseTooLargeError(
+                    f"Response from {response.url.split('?')[0]} exceeded {self.max_response_bytes} bytes"
+                )
+            yield chunk
+
+    def close(self):
+        self.session.close()
+
+
+def abort_connection(connection):
+    """
+    Shuts down the socket of a connection from another thread, waking a
+    thread blocked sending on it or reading from it, which then fails.
+    Closing the socket alone does not wake it.
+    """
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def abort_response(response: requests.Response):
+    """
+    Aborts an in-flight response from another thread.
+    """
+    abort_connection(getattr(response.raw, "connection", None))
+    response.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> SPARQLTransport:
+    """
+    Returns the process-wide transport, creating one with default settings on first use.
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = SPARQLTransport()
+        return _transport
+
+
+def set_transport(transport: SPARQLTransport):
+    """
+    Replaces the process-wide transport, e.g. with one built from the app configuration.
+    """
+    global _transport
+    with _transport_lock:
+        _transport = transport
@@ -0,0 +1,195 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable
+
+from http_utils import abort_connection, abort_response
+
+
+class QueryCancelledError(Exception):
+    """
+    Raised inside a query job once it has been cancelled or has run out of time.
+    """
+
+
+class QueryJob:
+    """
+    A handle on a query running on the worker pool. The worker reports
+    progress through `on_connection`, `on_response` and `on_chunk` (all can
+    be passed straight to run_sparql_query), and partial results through
+    `add_frame`. The UI thread reads the progress fields, and `cancel`
+    aborts the open HTTP requests, including those still waiting for the
+    endpoint to answer.
+    """
+
+    def __init__(self, label: str, timeout: float | None = None):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.timeout = timeout
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.bytes_received = 0
+        self.frames = []
+        self._rows = 0
+        self.info = {}
+        self.future: Future | None = None
+        self.cancel_reason = None
+        self._cancelled = threading.Event()
+        self._responses = set()
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def timed_out(self) -> bool:
+        return self.timeout is not None and self.elapsed > self.timeout
+
+    def cancel(self, reason: str = "Cancelled"):
+        """
+        Cancels the job and aborts its in-flight HTTP requests.
+        """
+        with self._lock:
+            if self.cancel_reason is None:
+                self.cancel_reason = reason
+            self._cancelled.set()
+            responses = list(self._responses)
+            connections = list(self._connections.values())
+        for connection in connections:
+            abort_connection(connection)
+        for response in responses:
+            abort_response(response)
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self):
+        """
+        Raises QueryCancelledError if the job was cancelled or its time is up.
+        """
+        if self.timed_out() and not self.cancelled:
+            self.cancel(f"Timed out after {self.timeout:g} seconds")
+        if self.cancelled:
+            raise QueryCancelledError(self.cancel_reason)
+
+    def on_connection(self, connection):
+        """
+        Tracks the connection a worker thread's request waits on, until it is
+        called with None once the response headers have arrived.
+        """
+        thread = threading.get_ident()
+        with self._lock:
+            if connection is None:
+                self._connections.pop(thread, None)
+                return
+            self._connections[thread] = connection
+            cancelled = self.cancelled
+        if cancelled:
+            abort_connection(connection)
+
+    def on_response(self, response):
+        with self._lock:
+            self._responses.add(response)
+            cancelled = self.cancelled
+        if cancelled:
+            abort_response(response)
+            raise QueryCancelledError(self.cancel_reason)
+
+    def on_chunk(self, size: int):
+        with self._lock:
+            self.bytes_received += size
+        self.check()
+
+    def add_frame(self, frame):
+        with self._lock:
+            self.frames.append(frame)
+            self._rows += len(frame)
+
+    @property
+    def rows_received(self) -> int:
+        with self._lock:
+            return self._rows
+
+    def first_frames(self, rows: int) -> list:
+        """
+        Returns the leading frames received so far that hold at least `rows`
+        rows between them (or all of them), enough to preview the result.
+        """
+        with self._lock:
+            frames, total = [], 0
+            for frame in self.frames:
+                if total >= rows:
+                    break
+                frames.append(frame)
+                total += len(frame)
+            return frames
+
+    def result(self):
+        """
+        Returns the value of the finished job, raising its error if it failed.
+        A job that was cancelled raises QueryCancelledError whatever its worker did.
+        """
+        if self.cancelled:
+            raise QueryCancelledError(self.cancel_reason)
+        return self.future.result()
+
+
+class QueryJobRunner:
+    """
+    A worker pool for query jobs, shared by all sessions.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-job")
+
+    def submit(self, work: Callable[[QueryJob], object], label: str = "",
+               timeout: float | None = None) -> QueryJob:
+        """
+        Starts `work(job)` on the pool and returns the job handle at once.
+        """
+        job = QueryJob(label, timeout)
+
+        def run():
+            try:
+                job.check()
+                return work(job)
+            finally:
+                job.finished_at = time.monotonic()
+
+        job.future = self._executor.submit(run)
+        return job
+
+
+def fan_out(calls: dict, max_workers: int = 8, timeout: float = 30) -> tuple[dict, dict]:
+    """
+    Runs the argument-less callables in `calls` concurrently, at most
+    `max_workers` at a time, and waits at most `timeout` seconds for all of
+    them. Returns the results and the errors, both keyed like `calls`. An
+    error is the exception a call raised, or a TimeoutError for a call still
+    running when the time was up.
+    """
+    results, errors = {}, {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls) or 1)))
+    try:
+        futures = {executor.submit(call): key for key, call in calls.items()}
+        done, not_done = wait(futures, timeout=timeout)
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+        for future in not_done:
+            errors[futures[future]] = TimeoutError(f"Timed out after {timeout:g} seconds")
+    finally:
+        # Stragglers are abandoned rather than awaited, so callers should bound their
+        # own I/O by about the same timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results, errors
@@ -0,0 +1,92 @@
+from typing import Iterator
+
+from query_utils import fenced_block_pattern
+
+# A fenced code block that has been closed, optionally tagged with a language
+_CLOSED_CODE_BLOCK = fenced_block_pattern()
+
+
+def complete_openai_chat(messages: list, model: str = "gpt-3.5-turbo", cache=None, **options) -> str:
+    """
+    Sends a chat completion request and returns the reply text. With a
+    cache_utils.LLMResponseCache, a request answered before is served from it.
+    """
+    key = cache.make_key("openai", model, messages, options) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    import openai
+
+    response = openai.ChatCompletion.create(model=model, messages=messages, **options)
+    text = response.choices[0].message["content"].strip()
+    if key is not None:
+        cache.set(key, text, provider="openai")
+    return text
+
+
+def stream_openai_chat(messages: list, model: str = "gpt-3.5-turbo", cache=None, **options) -> Iterator[str]:
+    """
+    Sends a chat completion request with stream=True and yields the text of each delta as it arrives.
+    A cached reply is yielded whole; a streamed one is cached once it has been read to the end.
+    """
+    key = cache.make_key("openai", model, messages, options) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    import openai
+
+    parts = []
+    for chunk in openai.ChatCompletion.create(model=model, messages=messages, stream=True, **options):
+        choices = chunk.get("choices")
+        if not choices:
+            continue
+        content = choices[0].get("delta", {}).get("content")
+        if content:
+            parts.append(content)
+            yield content
+    if key is not None and parts:
+        cache.set(key, "".join(parts), provider="openai")
+
+
+def stream_gemini(model, prompt: str, cache=None) -> Iterator[str]:
+    """
+    Generates content with a Gemini model using stream=True and yields the text of each chunk,
+    using the cache like stream_openai_chat.
+    """
+    key = cache.make_key("gemini", getattr(model, "model_name", ""), prompt) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    for chunk in model.generate_content(prompt, stream=True):
+        # Chunks without text (e.g. safety or finish metadata) raise on .text
+        try:
+            text = chunk.text
+        except ValueError:
+            continue
+        if text:
+            parts.append(text)
+            yield text
+    if key is not None and parts:
+        cache.set(key, "".join(parts), provider="gemini")
+
+
+def closed_code_block(text: str) -> str | None:
+    """
+    Returns the body of the first fenced code block in `text` that has been
+    closed, preferring one tagged as sparql, or None while none is complete.
+    Lets a streaming reply act on its query before the rest of it arrives.
+    """
+    blocks = _CLOSED_CODE_BLOCK.findall(text)
+    for language, body in blocks:
+        if language.lower() == "sparql":
+            return body.strip()
+    return blocks[0][1].strip() if blocks else None
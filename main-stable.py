@@ -82,7 +82,7 @@ def main():
         st.session_state.messages = []
 
     config = AppConfig()
-    chat_manager = ChatManager()
+    chat_manager = ChatManager(model=config.gemini().GenerativeModel("gemini-1.5-flash"))
 
     if 'df' not in st.session_state:
         st.session_state['df'] = pd.DataFrame()
@@ -1,16 +1,36 @@
+from perf_utils import RunTimer, TimingReport, HEAVY_MODULES
+
+# Started first so the report covers the whole run, imports included
+run_timer = RunTimer()
+
 import streamlit as st
 import streamlit_ace as ace
 import pandas as pd
-import openai
-import re
+import time
 import uuid
 import warnings
 import logging
 
+import config as app_config
 from config import AppConfig
-from sparql_utils import run_sparql_query
+from cache_utils import ResultCache, LLMResponseCache, normalize_query
+from http_utils import SPARQLTransport, set_transport
+from sparql_utils import run_sparql_query, iter_query_pages, concat_frames
+from federation_utils import run_federated_query
+from health_utils import EndpointProber
+from job_utils import QueryJobRunner, QueryCancelledError
+from ontology_utils import load_index
+from completion_utils import complete, trailing_term
+from prefix_utils import get_registry
+from query_utils import extract_query, extract_message_query
+from analysis_utils import guard_query
+from table_utils import column_metadata, ResultView
+from summary_utils import summarize_query, LLMSummaryCache
+from llm_utils import complete_openai_chat, stream_openai_chat, closed_code_block
+from context_utils import ConversationContext, EXACT_TOKEN_COUNTS
+from semantic_utils import SemanticQueryCache
+from candidate_utils import generate_candidates, rank_candidates
 # from server_utils import JSONLDServer  # Commented out as it's no longer needed
-from chat_utils import ChatManager
 from endpoints import SPARQL_ENDPOINTS
 
 # Suppress specific warnings
@@ -19,6 +39,106 @@ logging.getLogger('streamlit').setLevel(logging.ERROR)
 
 # Set page configuration
 st.set_page_config(layout="wide")
+run_timer.mark("imports")
+
+@st.cache_resource
+def get_app_config():
+    """
+    Reads the API keys once per process; the LLM clients are imported on first use.
+    """
+    return AppConfig()
+
+@st.cache_resource
+def get_timing_report():
+    """
+    Returns the process-wide report of script run timings.
+    """
+    return TimingReport()
+
+@st.cache_resource
+def get_result_cache():
+    """
+    Returns the process-wide SPARQL result cache shared by all sessions.
+    """
+    return ResultCache(
+        path=app_config.RESULT_CACHE_PATH,
+        max_bytes=app_config.RESULT_CACHE_MAX_BYTES,
+        memory_max_bytes=app_config.RESULT_CACHE_MEMORY_BYTES,
+        default_ttl=app_config.RESULT_CACHE_DEFAULT_TTL,
+        endpoint_ttls=app_config.RESULT_CACHE_ENDPOINT_TTLS,
+    )
+
+@st.cache_resource
+def get_llm_cache():
+    """
+    Returns the process-wide cache of LLM responses shared by all sessions.
+    """
+    return LLMResponseCache(
+        path=app_config.LLM_CACHE_PATH,
+        max_bytes=app_config.LLM_CACHE_MAX_BYTES,
+        memory_max_bytes=app_config.LLM_CACHE_MEMORY_BYTES,
+        ttl=app_config.LLM_CACHE_TTL,
+    )
+
+@st.cache_resource
+def get_semantic_cache():
+    """
+    Returns the process-wide store of chat prompts whose queries ran successfully.
+    """
+    return SemanticQueryCache(
+        path=app_config.SEMANTIC_CACHE_PATH,
+        threshold=app_config.SEMANTIC_MATCH_THRESHOLD,
+    )
+
+@st.cache_resource
+def get_sparql_transport():
+    """
+    Builds the pooled SPARQL transport once per process and makes it the default for all sessions.
+    """
+    transport = SPARQLTransport(
+        connect_timeout=app_config.HTTP_CONNECT_TIMEOUT,
+        read_timeout=app_config.HTTP_READ_TIMEOUT,
+        max_response_bytes=app_config.HTTP_MAX_RESPONSE_BYTES,
+        pool_hosts=app_config.HTTP_POOL_HOSTS,
+        pool_size=app_config.HTTP_POOL_SIZE,
+    )
+    set_transport(transport)
+    return transport
+
+@st.cache_resource
+def get_endpoint_prober():
+    """
+    Starts the background endpoint health prober once per process.
+    """
+    prober = EndpointProber(
+        [endpoint for endpoint in SPARQL_ENDPOINTS if endpoint != "Other"],
+        interval=app_config.HEALTH_PROBE_INTERVAL,
+        timeout=app_config.HEALTH_PROBE_TIMEOUT,
+        window=app_config.HEALTH_PROBE_WINDOW,
+    )
+    prober.start()
+    return prober
+
+@st.cache_resource
+def get_query_runner():
+    """
+    Returns the worker pool that runs queries for all sessions.
+    """
+    return QueryJobRunner(max_workers=app_config.QUERY_JOB_WORKERS)
+
+@st.cache_resource
+def get_llm_summaries():
+    """
+    Returns the process-wide cache of LLM-written query summaries, fetched in the background.
+    """
+    return LLMSummaryCache(llm_summarize_query)
+
+@st.cache_resource
+def get_ontology_index():
+    """
+    Memory-maps the ontology index once per process, building it first if it is missing or stale.
+    """
+    return load_index(app_config.ONTOLOGY_INDEX_PATH)
 
 def main():
     # Inject custom CSS to remove top padding
@@ -77,8 +197,11 @@ def main():
     # Now you can add your title without extra padding above it
     st.title("SparqlGPT - A Modular Refactor")
 
-    # Set OpenAI API key from Streamlit secrets
-    openai.api_key = st.secrets["OPENAI_API_KEY"]
+    config = get_app_config()
+    get_sparql_transport()
+    prober = get_endpoint_prober()
+    ontology = get_ontology_index()
+    run_timer.mark("shared resources")
 
     # Set a default model
     if "openai_model" not in st.session_state:
@@ -86,13 +209,11 @@ def main():
 
     # Initialize chat history
     if "messages" not in st.session_state:
-        st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I assist you today?"}]
+        st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I assist you today?", "id": uuid.uuid4().hex}]
 
-    config = AppConfig()
-    chat_manager = ChatManager()
 
     if 'df' not in st.session_state:
-        st.session_state['df'] = pd.DataFrame()
+        set_result(pd.DataFrame())
 
     # if 'jsonld_data' not in st.session_state:  # Commented out as it's no longer needed
     #     st.session_state['jsonld_data'] = ""
@@ -120,8 +241,8 @@ LIMIT 100
     if 'apply_query' not in st.session_state:
         st.session_state['apply_query'] = False
 
-    if 'button_key' not in st.session_state:
-        st.session_state['button_key'] = None
+    if 'chat_window' not in st.session_state:
+        st.session_state['chat_window'] = app_config.CHAT_WINDOW
 
     if 'query_executed' not in st.session_state:
         st.session_state['query_executed'] = False
@@ -138,30 +259,7 @@ LIMIT 100
             col1, col2 = st.columns([0.5, 0.5])
             with col1:
                 st.subheader("Table")
-                df = st.session_state['df']
-                if not df.empty:
-                    column_config = {}
-                    for column in df.columns:
-                        # Check if the column contains URLs starting with "http"
-                        if df[column].apply(lambda x: isinstance(x, str) and x.startswith("http")).any():
-                            column_config[column] = st.column_config.LinkColumn(
-                                column,
-                                help=f"Links in the {column} column"
-                            )
-
-                    # Display the DataFrame with clickable links using st.data_editor
-                    if not df.empty:
-                        st.data_editor(
-                            df,
-                            column_config=column_config,
-                            hide_index=False,
-                            height=400,
-                            key="data_editor_1"  # Unique key for this table
-
-
-                        )
-                    else:
-                        st.write("No data to show yet. Run a SPARQL query first.")
+                show_result_table("combined", height=400)
 
             with col2:
                 st.subheader("WebVOWL")
@@ -169,35 +267,14 @@ LIMIT 100
 
         with tab2:
             st.subheader("Table")
-            if not df.empty:
-                    column_config = {}
-                    for column in df.columns:
-                        # Check if the column contains URLs starting with "http"
-                        if df[column].apply(lambda x: isinstance(x, str) and x.startswith("http")).any():
-                            column_config[column] = st.column_config.LinkColumn(
-                                column,
-                                help=f"Links in the {column} column"
-                            )
-
-                    # Display the DataFrame with clickable links using st.data_editor
-                    if not df.empty:
-                        st.data_editor(
-                            df,
-                            column_config=column_config,
-                            hide_index=False,
-                            key="data_editor_2",  # Unique key for this table
-                            use_container_width=True  # Make it take up the whole page width
-
-
-                        )
-                    else:
-                        st.write("No data to show yet. Run a SPARQL query first.")
-
+            show_result_table("table", use_container_width=True)
 
         with tab3:
             st.subheader("WebVOWL")
             st.components.v1.iframe(webvowl_url, height=600, scrolling=True)
 
+    run_timer.mark("result tables")
+
     with bottom_section:
         tab1, tab2 = st.tabs(["Chat and Query Editor", "Visual Block Builder"])
 
@@ -210,38 +287,73 @@ LIMIT 100
                 # Create a placeholder for chat messages
                 chat_placeholder = st.empty()
 
-                # Function to display chat messages
+                # Function to render one chat message; only the last assistant message gets buttons
+                def render_message(i, msg):
+                    if msg.pop("streaming", False):
+                        # The run streaming this reply was interrupted, e.g. by Apply
+                        msg["content"] += "\n\n*(response interrupted)*"
+                    message_id = msg.setdefault("id", uuid.uuid4().hex)
+                    with st.chat_message(msg["role"]):
+                        st.markdown(msg["content"])
+                        # Check if the message contains a SPARQL query and is the last message
+                        if msg["role"] == "assistant" and i == len(st.session_state.messages) - 1:
+                            # Parsed once per message, whatever the number of reruns
+                            extracted_sparql_query, _ = extract_message_query(message_id, msg["content"])
+                            if extracted_sparql_query:
+                                st.button("Apply this query", key=f"apply_{message_id}",
+                                          on_click=apply_chat_query, args=(message_id,))
+                            if msg.get("semantic_match"):
+                                st.button("Ask the model instead", key=f"ask_model_{message_id}", on_click=ask_model_instead)
+
+                # Function to display the chat history, or the latest part of it, once per run
                 def display_chat():
+                    messages = st.session_state.messages
+                    start = max(0, len(messages) - st.session_state['chat_window'])
                     with chat_placeholder.container():
-                        with st.container(height=400, border=None,):
-                            for i, msg in enumerate(st.session_state.messages):
-                                with st.chat_message(msg["role"]):
-                                    st.markdown(msg["content"])
-                                    # Check if the message contains a SPARQL query and is the last message
-                                    if msg["role"] == "assistant" and i == len(st.session_state.messages) - 1:
-                                        extracted_sparql_query, extracted_prefixes = extract_sparql_query_and_prefixes(msg["content"])
-                                        if extracted_sparql_query:
-                                            if st.session_state['button_key'] is None:
-                                                st.session_state['button_key'] = f"apply_{i}_{msg['role']}_{uuid.uuid4()}"
-                                            button_clicked = st.button("Apply this query", key=st.session_state['button_key'])
-                                            if button_clicked:
-                                                st.session_state["sparql_query"] = extracted_prefixes + "\n\n" + extracted_sparql_query
-                                                st.session_state["apply_query"] = True
-                                                st.session_state['button_key'] = None
-                                                st.session_state['query_executed'] = False
-                                                st.session_state['ace_editor_content'] = st.session_state["sparql_query"]
-                                                st.session_state['update_ace_editor'] = True
-                                                st.session_state['reload'] = True
-                                                st.experimental_set_query_params(reload=st.session_state['reload'])
-
-                # Function to extract SPARQL query and prefixes from a message
-                def extract_sparql_query_and_prefixes(message):
-                    prefixes = re.findall(r"PREFIX\s+\w+:\s+<[^>]+>", message)
-                    query = re.search(r"SELECT.*?WHERE\s*\{.*?\}\s*(LIMIT\s*\d+)?", message, re.DOTALL)
-                    return query.group(0) if query else None, "\n".join(prefixes)
+                        chat_box = st.container(height=400, border=None,)
+                        with chat_box:
+                            if start > 0:
+                                st.button(f"Load older messages ({start} hidden)", key="chat_load_older",
+                                          on_click=load_older_messages)
+                            for i in range(start, len(messages)):
+                                render_message(i, messages[i])
+                    return chat_box
+
+                # Function to add a message below the ones already shown
+                def append_message(chat_box, msg):
+                    st.session_state.messages.append(msg)
+                    with chat_box:
+                        render_message(len(st.session_state.messages) - 1, msg)
+
+                # Function to render an assistant reply while it streams in
+                def stream_reply(chat_box, chunks):
+                    message = {"role": "assistant", "content": "", "streaming": True, "id": uuid.uuid4().hex}
+                    st.session_state.messages.append(message)
+                    with chat_box:
+                        with st.chat_message("assistant"):
+                            text_placeholder, button_placeholder = st.empty(), st.empty()
+                            button_shown = False
+                            last_render = 0.0
+                            for chunk in chunks:
+                                message["content"] += chunk
+                                if time.monotonic() - last_render > 0.05:
+                                    text_placeholder.markdown(message["content"] + "▌")
+                                    last_render = time.monotonic()
+                                # Offer the query as soon as its code block closes, while the explanation streams on
+                                if not button_shown:
+                                    block = closed_code_block(message["content"])
+                                    if block and extract_query(block)[0]:
+                                        button_placeholder.button("Apply this query", key=f"apply_{message['id']}",
+                                                                  on_click=apply_chat_query, args=(message["id"],))
+                                        button_shown = True
+                            text_placeholder.markdown(message["content"])
+                            if not button_shown and extract_message_query(message["id"], message["content"])[0]:
+                                button_placeholder.button("Apply this query", key=f"apply_{message['id']}",
+                                                          on_click=apply_chat_query, args=(message["id"],))
+                    message.pop("streaming")
 
                 # Display conversation history
-                display_chat()
+                chat_box = display_chat()
 
                 # Apply the query if the button was clicked
                 if st.session_state["apply_query"]:
@@ -254,31 +366,66 @@ LIMIT 100
                 #     st.experimental_set_query_params(reload=st.session_state['reload'])
 
                 # Accept user input
-                if prompt := st.chat_input("Ask for a SPARQL query in the code block format or data insights...", key="chat_input_left"):
-                    # Add user message to chat history
-                    st.session_state.messages.append({"role": "user", "content": prompt})
-                    # Reset button key for new query
-                    st.session_state['button_key'] = None
-                    # Display user message in chat message container
-                    display_chat()
-
-                    # Display assistant response in chat message container
-                    response = openai.ChatCompletion.create(
-                        model=st.session_state["openai_model"],
-                        messages=[
+                prompt = st.chat_input("Ask for a SPARQL query in the code block format or data insights...", key="chat_input_left")
+                ask_model = st.session_state.pop('ask_model', False)
+                if prompt:
+                    # Add user message to chat history, below the messages already shown
+                    append_message(chat_box, {"role": "user", "content": prompt, "id": uuid.uuid4().hex})
+
+                    # Offer the query of a close enough earlier question right away
+                    match = get_semantic_cache().match(prompt, endpoint=st.session_state['sparql_endpoint'])
+                    if match is not None:
+                        append_message(chat_box, {
+                            "role": "assistant",
+                            # The cache is shared by all sessions, so the earlier question itself is not shown
+                            "content": f"A query written for a similar earlier question ({match['score']:.0%} similar) "
+                                       f"ran successfully on this endpoint:"
+                                       f"\n\n```sparql\n{match['query'].strip()}\n```",
+                            "semantic_match": True,
+                            "id": uuid.uuid4().hex,
+                        })
+                    else:
+                        ask_model = True
+
+                if ask_model:
+                    # Keep the prompt within budget: recent turns verbatim, older ones summarized
+                    messages = get_chat_context().build(
+                        st.session_state.messages,
+                        system=[
                             {"role": "system", "content": f"The current SPARQL query is: {st.session_state['sparql_query']}"},
                             {"role": "system", "content": f"The current SPARQL endpoint is: {st.session_state['sparql_endpoint']}"},
-                            *[
-                                {"role": m["role"], "content": m["content"]}
-                                for m in st.session_state.messages
-                            ]
-                        ]
+                        ],
+                        current_query=st.session_state['sparql_query'],
                     )
-                    response_text = response.choices[0].message["content"]
-                    st.session_state.messages.append({"role": "assistant", "content": response_text})
 
-                    # Update chat display
-                    display_chat()
+                    config.openai()
+                    if st.session_state.get("query_candidates"):
+                        # Let several candidate queries compete; only the best one is offered to apply
+                        with chat_box, st.spinner(f"Generating and testing {app_config.QUERY_CANDIDATES} candidate queries…"):
+                            reply = best_candidate_reply(messages)
+                        append_message(chat_box, {"role": "assistant", "content": reply, "id": uuid.uuid4().hex})
+                    else:
+                        # Stream the assistant response into the chat message container
+                        stream_reply(chat_box, stream_openai_chat(
+                            messages, model=st.session_state["openai_model"], cache=get_llm_cache()
+                        ))
+
+                st.checkbox(
+                    "Compare candidate queries",
+                    key="query_candidates",
+                    help=f"Ask for {app_config.QUERY_CANDIDATES} queries at once, test each against the endpoint "
+                         f"with LIMIT {app_config.CANDIDATE_DRY_RUN_LIMIT} and offer the one that works best"
+                )
+
+                if "chat_context" in st.session_state and st.session_state["chat_context"].stats:
+                    stats = st.session_state["chat_context"].stats[-1]
+                    approx = "" if EXACT_TOKEN_COUNTS else "~"
+                    saved = 1 - stats["prompt_tokens"] / max(stats["history_tokens"], 1)
+                    st.caption(
+                        f"Last prompt: {approx}{stats['prompt_tokens']:,} tokens "
+                        f"(full history: {approx}{stats['history_tokens']:,}, {saved:.0%} saved, "
+                        f"{stats['summarized_messages']} messages summarized)"
+                    )
 
                 # Add a button to reset the chat
                 st.markdown("""
@@ -291,6 +438,8 @@ LIMIT 100
                 if st.button("Reset Chat" , key="red", type="primary"):
                     st.experimental_set_query_params(reload=True)
                     st.session_state.messages = []
+                    st.session_state.pop("chat_context", None)
+                    st.session_state['chat_window'] = app_config.CHAT_WINDOW
                     st.rerun()
 
             with col_right:
@@ -322,19 +471,84 @@ LIMIT 100
                 # Update the session state with the current content of the editor
                 st.session_state["ace_editor_content"] = ace_editor_content
 
+                # st_ace has no completer hook, so ontology suggestions are listed below the editor,
+                # for the name typed here or else the partial name at the end of the query
+                with st.expander("Ontology Suggestions", expanded=True):
+                    lookup = st.text_input("Class, property or prefix", key="ontology_lookup",
+                                           placeholder="e.g. dbo:birth, Person or db")
+                    suggestions = complete(ontology, lookup or trailing_term(ace_editor_content), ace_editor_content)
+                    if suggestions:
+                        st.dataframe(pd.DataFrame(suggestions), hide_index=True, use_container_width=True,
+                                     column_config={"iri": st.column_config.LinkColumn("iri")})
+                    else:
+                        st.caption("Type a name, or add `?x a dbo:SomeClass` to the query to see its properties")
+
                 # Add SPARQL endpoint input field below the query editor
-                selected_endpoint = st.selectbox("Select SPARQL Endpoint", SPARQL_ENDPOINTS, index=SPARQL_ENDPOINTS.index(st.session_state.get('sparql_endpoint', "https://dbpedia.org/sparql")) if st.session_state.get('sparql_endpoint', "https://dbpedia.org/sparql") in SPARQL_ENDPOINTS else SPARQL_ENDPOINTS.index("Other"))
+                # Healthiest endpoints first, re-sorted only once per probe round so the list
+                # doesn't move under the cursor; labels are plain URLs and health goes in a caption
+                if st.session_state.get("endpoint_order_round") != prober.rounds:
+                    st.session_state["endpoint_order"] = prober.ranked_endpoints() + ["Other"]
+                    st.session_state["endpoint_order_round"] = prober.rounds
+                endpoint_options = st.session_state["endpoint_order"]
+                current_endpoint = st.session_state.get('sparql_endpoint', "https://dbpedia.org/sparql")
+                selected_endpoint = st.selectbox(
+                    "Select SPARQL Endpoint",
+                    endpoint_options,
+                    index=endpoint_options.index(current_endpoint) if current_endpoint in endpoint_options else endpoint_options.index("Other"),
+                    key="endpoint_choice",
+                )
 
                 if selected_endpoint == "Other":
                     sparql_endpoint = st.text_input("Enter SPARQL Endpoint", st.session_state.get('sparql_endpoint', ""))
                 else:
+                    st.caption(prober.describe(selected_endpoint))
                     sparql_endpoint = selected_endpoint
 
                 st.session_state['sparql_endpoint'] = sparql_endpoint
 
+                st.checkbox(
+                    "AI summary",
+                    key="llm_summary",
+                    help="Also ask the LLM to describe each successful query; it appears when ready"
+                )
+
+                st.checkbox(
+                    "Paged execution",
+                    key="paged_execution",
+                    help=f"Fetch SELECT results in pages of {app_config.QUERY_PAGE_SIZE} rows "
+                         f"(up to {app_config.QUERY_MAX_ROWS} rows) and show them as they arrive"
+                )
+
+                with st.expander("Federated Query"):
+                    federated_endpoints = st.multiselect(
+                        "Endpoints to query concurrently",
+                        [endpoint for endpoint in SPARQL_ENDPOINTS if endpoint != "Other"],
+                        default=["https://dbpedia.org/sparql"],
+                        key="federated_endpoints"
+                    )
+                    if st.checkbox("Use a different query per endpoint", key="federated_per_endpoint"):
+                        for endpoint in federated_endpoints:
+                            query_key = f"federated_query_{endpoint}"
+                            if query_key not in st.session_state:
+                                st.session_state[query_key] = ace_editor_content
+                            st.text_area(endpoint, key=query_key, height=150)
+                    st.button("▶ Run Federated Query", key="run_federated_query", on_click=run_federated,
+                              disabled=not federated_endpoints)
+                    st.button("↻ Refresh Federated Query", key="refresh_federated_query", on_click=run_federated,
+                              kwargs={"refresh": True}, disabled=not federated_endpoints,
+                              help="Skip the cached results and re-run the query against every endpoint")
+
+                    report = st.session_state.get('federation_report')
+                    if report:
+                        st.dataframe(
+                            pd.DataFrame.from_dict(report, orient="index").rename_axis("endpoint"),
+                            column_config={"elapsed": st.column_config.NumberColumn("elapsed (s)", format="%.2f")}
+                        )
+
                 with col_run_button:
-                    if st.button("▶ Run Query", key="run_merged_query", on_click=run_query):
-                        st.session_state['query_executed'] = True
+                    st.button("▶ Run Query", key="run_merged_query", on_click=run_query)
+                    st.button("↻ Refresh", key="refresh_query", on_click=run_query, kwargs={"refresh": True},
+                              help="Drop the cached result and re-run the query against the endpoint")
 
                     st.markdown(
                         """
@@ -348,67 +562,545 @@ LIMIT 100
                         unsafe_allow_html=True
                     )
 
+                # Progress and Cancel button for a running query, polling only while there is one
+                if st.session_state.get('query_job') is not None:
+                    show_query_job()
+                show_query_analysis()
+
+                if st.session_state.get('injected_prefixes'):
+                    st.caption("Added missing PREFIX declarations: " +
+                               ", ".join(f"`{prefix}:`" for prefix in st.session_state['injected_prefixes']))
+                if st.session_state.get('unknown_prefixes'):
+                    st.warning("Undeclared prefixes not found in the prefix registry: " +
+                               ", ".join(f"`{prefix}:`" for prefix in st.session_state['unknown_prefixes']))
+
                 # Create a placeholder for the success message
                 query_placeholder = st.empty()
 
                 # Display the success message in the placeholder
                 if 'query_executed' in st.session_state and st.session_state['query_executed']:
                     if 'query_success' in st.session_state and st.session_state['query_success']:
-                        context = extract_context(st.session_state["sparql_query"])
+                        # Summarized locally so the banner doesn't wait on an LLM call
+                        context = summarize_query(st.session_state["sparql_query"])
                         query_placeholder.success(f"{context}")
+                        if st.session_state.get('llm_summary'):
+                            show_llm_summary(st.session_state["sparql_query"])
+                        source = {"cache": "cache", "mixed": "cache and the endpoints"}.get(
+                            st.session_state.get('query_source'), "the endpoint")
+                        st.caption(f"{len(st.session_state['df'])} rows loaded from {source} "
+                                   f"in {st.session_state.get('query_elapsed_ms', 0):.0f} ms")
+                    elif st.session_state.get('query_error'):
+                        query_placeholder.error(st.session_state['query_error'])
+                        fallback = prober.pick_fallback(exclude=[st.session_state['sparql_endpoint']])
+                        if fallback:
+                            st.info(f"{st.session_state['sparql_endpoint']} may be unavailable. "
+                                    f"{fallback} is currently responding well.")
                     st.session_state['query_executed'] = False
 
                 # Display the query output below the success message in an expansion section
                 
-                # Detect columns that contain HTTP URLs and create a LinkColumn for them
-                column_config = {}
-                for column in st.session_state['df'].columns:
-                    # Check if the column contains URLs starting with "http"
-                    if st.session_state['df'][column].apply(lambda x: isinstance(x, str) and x.startswith("http")).any():
-                        column_config[column] = st.column_config.LinkColumn(
-                            column,
-                            help=f"More information on {column}"
-                        )
-
-                # Use `st.data_editor` to display the DataFrame with LinkColumn
                 with st.expander("Query Results"):
-                    if not st.session_state['df'].empty:
-                        st.data_editor(
-                            st.session_state['df'],
-                            column_config=column_config,
-                            hide_index=True
-                        )
-                    else:
-                        st.write("No data to show yet. Run a SPARQL query first.")
+                    show_result_table("results")
 
         with tab2:
             st.subheader("Visual Block Builder")
             st.components.v1.iframe("https://leipert.github.io/vsb/dbpedia/#/workspace", height=800, scrolling=True)
 
-def run_query():
+    run_timer.mark("chat and editor")
+    get_timing_report().record(run_timer)
+    if app_config.SHOW_PERFORMANCE_PANEL:
+        with st.expander("Performance"):
+            show_timing_report(get_timing_report().summary())
+
+def set_result(df):
+    """
+    Stores a query result together with its column metadata, computed once here rather than on every rerun.
+    """
+    st.session_state["df"] = df
+    st.session_state["df_meta"] = column_metadata(df)
+    st.session_state["df_version"] = st.session_state.get("df_version", 0) + 1
+
+def get_result_view():
+    """
+    Returns the server-side view of the current result, shared by all result tables of the session.
+    """
+    view = st.session_state.get("result_view")
+    if view is None or view.version != st.session_state["df_version"]:
+        view = ResultView(st.session_state["df"], st.session_state["df_version"])
+        st.session_state["result_view"] = view
+    return view
+
+def show_result_table(key, height=None, use_container_width=False):
+    """
+    Shows one page of the current result. Search, sorting and paging run on
+    the server against the shared result view, so only the visible page is
+    sent to the browser.
+    """
+    df = st.session_state['df']
+    if df.empty:
+        st.write("No data to show yet. Run a SPARQL query first.")
+        return
+
+    view = get_result_view()
+    col_search, col_sort, col_order = st.columns([0.5, 0.3, 0.2])
+    with col_search:
+        search = st.text_input("Search", key=f"{key}_search", placeholder="Filter rows containing…")
+    with col_sort:
+        sort_by = st.selectbox("Sort by", [None, *df.columns], key=f"{key}_sort",
+                               format_func=lambda column: "—" if column is None else column)
+    with col_order:
+        descending = st.toggle("Descending", key=f"{key}_descending")
+
+    rows = view.rows(search, sort_by, not descending)
+    page_size = app_config.RESULT_PAGE_SIZE
+    pages = max(1, -(-len(rows) // page_size))
+    # Keep the page in range when a new search or result has fewer pages
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page = st.number_input("Page", min_value=1, max_value=pages, key=f"{key}_page") if pages > 1 else 1
+
+    st.dataframe(
+        view.page(page, page_size, search, sort_by, not descending),
+        column_config=result_column_config(st.session_state['df_meta']),
+        height=height,
+        use_container_width=use_container_width,
+    )
+    start = (page - 1) * page_size
+    st.caption(f"Rows {min(start + 1, len(rows))}–{min(start + page_size, len(rows))} of {len(rows)}"
+               + (f" matching (of {len(df)})" if len(rows) != len(df) else ""))
+
+def result_column_config(meta):
+    """
+    Builds the column configuration shared by the result tables: links are clickable.
+    """
+    return {
+        column: st.column_config.LinkColumn(column, help=f"Links in the {column} column")
+        for column in meta["link"]
+    }
+
+def declare_missing_prefixes(query):
+    """
+    Adds the PREFIX declarations the query is missing from the prefix registry,
+    showing the completed query in the editor and noting what was added.
+    """
+    registry = get_registry()
+    query, added = registry.inject(query)
+    _, unknown = registry.missing_declarations(query)
+    st.session_state['injected_prefixes'] = added
+    st.session_state['unknown_prefixes'] = unknown
+    if added:
+        st.session_state["sparql_query"] = query
+        st.session_state["ace_editor_content"] = query
+        st.session_state['update_ace_editor'] = True
+    return query
+
+def preflight_query(query, run, force=False, bounded=False, show_in_editor=True, endpoint=None, run_options=None):
+    """
+    Analyzes a query before it is sent and applies the configured guard. Returns
+    the query to run, with a LIMIT added if the guard added one, or None if the
+    guard refused it. `force` skips the refusal for a "Run anyway", which reruns
+    `run` with `run_options`. Each analysis is added to st.session_state['query_analyses'],
+    labelled with `endpoint` when the endpoints of a federated run each get their own query.
+    """
+    mode = app_config.SPARQL_GUARD_MODE
+    if force and mode == "block":
+        mode = "limit"
+    guarded, analysis, refusal = guard_query(query, mode, app_config.SAFE_LIMIT, bounded=bounded)
+    st.session_state.setdefault('query_analyses', []).append({
+        "endpoint": endpoint,
+        "analysis": analysis if mode != "off" else None,
+        "added_limit": guarded != query,
+        "refused": refusal is not None,
+    })
+    if refusal:
+        message = f"{endpoint}: {refusal}" if endpoint else refusal
+        previous = st.session_state.get('query_refusal')
+        if previous is not None:
+            message = previous[0] + "\n\n" + message
+        st.session_state['query_refusal'] = (message, run, run_options or {})
+        return None
+    if guarded != query and show_in_editor:
+        st.session_state["sparql_query"] = guarded
+        st.session_state["ace_editor_content"] = guarded
+        st.session_state['update_ace_editor'] = True
+    return guarded
+
+def reset_query_analysis():
+    st.session_state['query_analyses'] = []
+    st.session_state['query_refusal'] = None
+
+def show_query_analysis():
+    refusal = st.session_state.get('query_refusal')
+    for entry in st.session_state.get('query_analyses', []):
+        on = f" on {entry['endpoint']}" if entry["endpoint"] else ""
+        if entry["added_limit"] and not entry["refused"]:
+            st.caption(f"Added LIMIT {app_config.SAFE_LIMIT} to the unbounded query{on}")
+        analysis = entry["analysis"]
+        if analysis is not None and analysis.issues:
+            with st.expander(f"Estimated query cost{on}: {analysis.cost}", expanded=entry["refused"]):
+                for issue in analysis.issues:
+                    st.markdown(f"- **{issue['severity']}**: {issue['message']}")
+    if refusal is not None:
+        message, run, run_options = refusal
+        st.error(message)
+        st.button("Run anyway", key="run_anyway", on_click=run_federated if run == "federated" else run_query,
+                  kwargs={**run_options, "force": True})
+
+def run_query(refresh=False, force=False):
+    """
+    Starts the query in the editor on the worker pool and keeps the job handle in session state.
+    """
+    query = declare_missing_prefixes(st.session_state["ace_editor_content"])
+    endpoint = st.session_state['sparql_endpoint']
+    paged = st.session_state.get('paged_execution', False)
+    # A query applied from the chat and run unchanged can teach the semantic cache its question
+    applied = st.session_state.get('applied_prompt')
+    prompt = applied[0] if applied and normalize_query(applied[1]) == normalize_query(query) else None
+    # Paged execution already stops at QUERY_MAX_ROWS
+    reset_query_analysis()
+    query = preflight_query(query, "query", force=force, bounded=paged, run_options={"refresh": refresh})
+    if query is None:
+        return
+    cache = get_result_cache()
+    get_sparql_transport()
+    start_query_job(
+        lambda job: execute_query(job, query, endpoint, paged, refresh, cache),
+        label=endpoint,
+        query=query,
+        info={"endpoint": endpoint, "prompt": prompt}
+    )
+
+def run_federated(refresh=False, force=False):
+    """
+    Starts a federated query over the selected endpoints on the worker pool.
+    """
+    query = declare_missing_prefixes(st.session_state["ace_editor_content"])
+    endpoints = st.session_state.get('federated_endpoints', [])
+    reset_query_analysis()
+    if st.session_state.get('federated_per_endpoint'):
+        registry = get_registry()
+        queries = {endpoint: registry.inject(st.session_state.get(f"federated_query_{endpoint}", query))[0]
+                   for endpoint in endpoints}
+        # Each endpoint's query is checked and reported on its own
+        for endpoint in endpoints:
+            queries[endpoint] = preflight_query(queries[endpoint], "federated", force=force,
+                                                show_in_editor=False, endpoint=endpoint,
+                                                run_options={"refresh": refresh})
+        if any(endpoint_query is None for endpoint_query in queries.values()):
+            return
+    else:
+        query = preflight_query(query, "federated", force=force, run_options={"refresh": refresh})
+        if query is None:
+            return
+        queries = dict.fromkeys(endpoints, query)
+    cache = get_result_cache()
+    get_sparql_transport()
+    start_query_job(
+        lambda job: execute_federated_query(job, queries, refresh, cache),
+        label=f"{len(queries)} endpoints",
+        query=query
+    )
+
+def start_query_job(work, label, query, info=None):
+    current = st.session_state.get('query_job')
+    if current is not None and not current.done():
+        current.cancel("Superseded by a new query")
+    job = get_query_runner().submit(work, label=label, timeout=app_config.QUERY_TIMEOUT)
+    job.info.update(info or {})
+    job.info["query"] = query
+    st.session_state['query_job'] = job
+
+def execute_query(job, query, endpoint, paged, refresh, cache):
+    """
+    Runs on a worker thread: serves the query from the result cache or
+    fetches it, reporting progress and partial pages through the job.
+    """
+    result_format = app_config.SPARQL_RESULT_FORMAT
+    cache_format = f"{result_format}-paged" if paged else result_format
+    if refresh:
+        cache.invalidate(query, endpoint, cache_format)
+    df = cache.get(query, endpoint, cache_format)
+    if df is not None:
+        job.info["source"] = "cache"
+        return df
+
+    request_options = {"timeout": job.timeout, "on_connection": job.on_connection,
+                       "on_response": job.on_response, "on_chunk": job.on_chunk}
+    if paged:
+        for page in iter_query_pages(
+            query,
+            endpoint,
+            page_size=app_config.QUERY_PAGE_SIZE,
+            max_rows=app_config.QUERY_MAX_ROWS,
+            max_workers=app_config.QUERY_PAGE_WORKERS,
+            result_format=result_format,
+            **request_options
+        ):
+            job.add_frame(page)
+            job.check()
+        df = concat_frames(job.frames) if job.frames else pd.DataFrame()
+    else:
+        df = run_sparql_query(query, endpoint, result_format, **request_options)
+    job.check()
+    cache.set(query, endpoint, df, cache_format)
+    job.info["source"] = "network"
+    return df
+
+def execute_federated_query(job, queries, refresh, cache):
+    df, report = run_federated_query(
+        queries,
+        max_workers=app_config.FEDERATION_MAX_WORKERS,
+        timeout=app_config.FEDERATION_TIMEOUT,
+        result_format=app_config.SPARQL_RESULT_FORMAT,
+        cache=cache,
+        refresh=refresh,
+        on_connection=job.on_connection,
+        on_response=job.on_response,
+        on_chunk=job.on_chunk
+    )
+    job.info["report"] = report
+    cached = {info["cached"] for info in report.values() if info["error"] is None}
+    job.info["source"] = "mixed" if len(cached) > 1 else "cache" if cached == {True} else "network"
+    job.check()
+    if all(info["error"] for info in report.values()):
+        raise RuntimeError("No endpoint answered the federated query.")
+    return df
+
+def finish_query_job(job):
+    """
+    Moves the outcome of a finished or cancelled job into session state.
+    """
+    st.session_state['query_job'] = None
+    st.session_state['query_executed'] = True
+    st.session_state['query_elapsed_ms'] = job.elapsed * 1000
+    st.session_state['query_error'] = None
+    if "report" in job.info:
+        st.session_state['federation_report'] = job.info["report"]
     try:
-        df = run_sparql_query(
-            st.session_state["ace_editor_content"],
-            st.session_state['sparql_endpoint']
-        )
-        st.session_state["df"] = df
-        st.session_state["sparql_query"] = st.session_state["ace_editor_content"]
-        st.session_state['query_success'] = True
+        df = job.result()
+    except QueryCancelledError as e:
+        st.session_state['query_success'] = False
+        st.session_state['query_error'] = f"Query stopped: {e}"
+        # Pages that arrived before the stop are kept
+        if job.frames:
+            set_result(concat_frames(job.frames))
+        return
     except Exception as e:
         st.session_state['query_success'] = False
-        st.error(f"Error running SPARQL: {e}")
+        st.session_state['query_error'] = f"Error running SPARQL: {e}"
+        return
+    set_result(df)
+    if job.info.get("prompt") and not df.empty:
+        get_semantic_cache().add(job.info["prompt"], job.info["query"], job.info["endpoint"])
+        st.session_state['applied_prompt'] = None
+    st.session_state["sparql_query"] = job.info["query"]
+    st.session_state['query_source'] = job.info.get("source", "network")
+    st.session_state['query_success'] = True
+
+@st.fragment(run_every=0.5)
+def show_query_job():
+    """
+    Shows the progress of the running query job and lets the user cancel it.
+    Reruns on its own every half second, without rerunning the rest of the app.
+    """
+    job = st.session_state.get('query_job')
+    if job is None:
+        return
+    if not job.done() and job.timed_out():
+        job.cancel(f"Timed out after {job.timeout:g} seconds")
+    if job.done() or job.cancelled:
+        finish_query_job(job)
+        st.rerun()
+
+    col_status, col_cancel = st.columns([0.75, 0.25])
+    with col_status:
+        progress = f"Running on {job.label}: {job.elapsed:.1f} s, {job.bytes_received / 1024:,.0f} KB received"
+        rows = job.rows_received
+        if rows:
+            progress += f", {rows} rows"
+        st.info(progress)
+    with col_cancel:
+        if st.button("✖ Cancel", key=f"cancel_{job.id}"):
+            job.cancel()
+            finish_query_job(job)
+            st.rerun()
+
+    # Only the first rows are previewed; the whole result is stored once, when the job finishes
+    preview = job.first_frames(100)
+    if preview:
+        st.dataframe(concat_frames(preview).head(100), height=200)
+
+def show_llm_summary(query):
+    """
+    Shows the LLM-written summary of a query, polling for it only while the background request runs.
+    """
+    summaries = get_llm_summaries()
+    summary = summaries.request(query)
+    pending = summaries.pending(query)
+    # The request may have finished in between
+    summary = summary or summaries.get(query)
+    if summary:
+        st.caption(f"🤖 {summary}")
+    elif pending:
+        wait_for_llm_summary(query)
+
+@st.fragment(run_every=1)
+def wait_for_llm_summary(query):
+    """
+    Reruns on its own every second until the summary request has finished,
+    then reruns the app once to show the result banner with the summary.
+    """
+    if get_llm_summaries().pending(query):
+        st.caption("🤖 Writing a summary…")
+        return
+    st.session_state['query_executed'] = True
+    st.rerun()
+
+def apply_chat_query(message_id):
+    """
+    Puts the query of a chat message into the editor, declaring any prefix the model used but left out.
+    """
+    messages = st.session_state.messages
+    i = next((i for i, msg in enumerate(messages) if msg.get("id") == message_id), None)
+    if i is None:
+        return
+    extracted_sparql_query, extracted_prefixes = extract_message_query(message_id, messages[i]["content"])
+    if not extracted_sparql_query:
+        return
+    st.session_state["sparql_query"], _ = get_registry().inject(extracted_prefixes + "\n\n" + extracted_sparql_query)
+    # Remember which question it answers, in case it runs successfully
+    asked = [msg["content"] for msg in messages[:i] if msg["role"] == "user"]
+    if asked:
+        st.session_state['applied_prompt'] = (asked[-1], st.session_state["sparql_query"])
+    st.session_state["apply_query"] = True
+    st.session_state['query_executed'] = False
+    st.session_state['ace_editor_content'] = st.session_state["sparql_query"]
+    st.session_state['update_ace_editor'] = True
+    st.session_state['reload'] = True
+    st.experimental_set_query_params(reload=st.session_state['reload'])
+
+def ask_model_instead():
+    """
+    Drops the answer found in the semantic cache and lets the model answer the question.
+    """
+    st.session_state.messages.pop()
+    st.session_state['ask_model'] = True
+
+def load_older_messages():
+    st.session_state['chat_window'] += app_config.CHAT_WINDOW
+
+def show_timing_report(report):
+    cold_start = report["cold_start"]
+    if cold_start is not None:
+        imports = dict(cold_start["steps"]).get("imports", 0)
+        st.caption(f"Cold start: {cold_start['total']:.2f} s, of which imports {imports:.2f} s")
+    if report["reruns"]:
+        st.caption(
+            f"Reruns: {report['reruns']}, median {report['rerun_median'] * 1000:.0f} ms, "
+            f"slowest {report['rerun_max'] * 1000:.0f} ms"
+        )
+    run = report["last_rerun"] or cold_start
+    if run is not None:
+        st.dataframe(
+            pd.DataFrame([(name, seconds * 1000) for name, seconds in run["steps"]], columns=["step", "ms"]),
+            hide_index=True,
+            column_config={"ms": st.column_config.NumberColumn("ms", format="%.1f")},
+        )
+    llm_cache = get_llm_cache().stats()
+    st.caption(
+        f"LLM response cache: {llm_cache['hits']} hits, {llm_cache['misses']} misses, "
+        f"{llm_cache['entries']} entries ({llm_cache['bytes'] / 1024:,.0f} KB)"
+    )
+    not_loaded = [name for name in HEAVY_MODULES if name not in report["loaded_modules"]]
+    st.caption(f"Not imported yet: {', '.join(not_loaded) if not_loaded else 'none'}")
+
+def best_candidate_reply(messages):
+    """
+    Asks the model for several replies concurrently, dry-runs their queries against the
+    selected endpoint and returns the reply with the best query, noting how the others fared.
+    """
+    model = st.session_state["openai_model"]
+    cache = get_llm_cache()
+    # A different seed per candidate gives different samples, each cached on its own
+    replies = generate_candidates(
+        lambda i: complete_openai_chat(messages, model=model, cache=cache,
+                                       temperature=app_config.CANDIDATE_TEMPERATURE, seed=i),
+        k=app_config.QUERY_CANDIDATES,
+        max_workers=app_config.QUERY_CANDIDATES,
+        timeout=app_config.CANDIDATE_GENERATION_TIMEOUT,
+    )
+    if not replies:
+        return "*(no reply from the model)*"
+
+    registry = get_registry()
+    candidates = []
+    for reply in replies:
+        query, prefixes = extract_query(reply)
+        candidates.append((reply, registry.inject(prefixes + "\n\n" + query)[0] if query else None))
+    results = rank_candidates(
+        candidates,
+        st.session_state['sparql_endpoint'],
+        limit=app_config.CANDIDATE_DRY_RUN_LIMIT,
+        timeout=app_config.CANDIDATE_DRY_RUN_TIMEOUT,
+        max_workers=app_config.QUERY_CANDIDATES,
+        result_format=app_config.SPARQL_RESULT_FORMAT,
+    )
 
-def extract_context(query):
-    prompt = f"SPARQL query about <blank> ran successfully! for the following SPARQL query: {query}"
-    response = openai.ChatCompletion.create(
+    labels = {"rows": "returned results", "empty": "returned nothing", "error": "failed",
+              "invalid": "did not parse", "no_query": "had no query"}
+    counts = {}
+    for result in results:
+        counts[labels[result["status"]]] = counts.get(labels[result["status"]], 0) + 1
+    best = results[0]
+    note = (f"*Best of {len(results)} candidates tested with LIMIT {app_config.CANDIDATE_DRY_RUN_LIMIT}: "
+            + ", ".join(f"{count} {label}" for label, count in counts.items()) + ".")
+    if best["status"] in ("error", "invalid"):
+        note += f" Its error: {best['error'].splitlines()[0][:200]}"
+    return best["reply"] + "\n\n" + note + "*"
+
+def get_chat_context():
+    """
+    Returns this session's conversation context, which holds the rolling summary of older chat turns.
+    """
+    if "chat_context" not in st.session_state:
+        st.session_state["chat_context"] = ConversationContext(
+            summarize=llm_summarize_conversation,
+            budget=app_config.CHAT_CONTEXT_BUDGET,
+            keep_turns=app_config.CHAT_KEEP_TURNS,
+            summary_tokens=app_config.CHAT_SUMMARY_TOKENS,
+            model=st.session_state["openai_model"],
+        )
+    return st.session_state["chat_context"]
+
+def llm_summarize_conversation(summary, transcript):
+    prompt = (
+        f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{transcript}\n\n"
+        "Update the summary of this conversation about SPARQL queries. Keep the user's goals, "
+        "the entities and properties involved and the latest query proposed. Be brief."
+    )
+    get_app_config().openai()
+    return complete_openai_chat(
+        [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ],
         model="gpt-3.5-turbo",
-        messages=[
+        cache=get_llm_cache(),
+        max_tokens=app_config.CHAT_SUMMARY_TOKENS
+    )
+
+def llm_summarize_query(query):
+    prompt = f"SPARQL query about <blank> ran successfully! for the following SPARQL query: {query}"
+    get_app_config().openai()
+    return complete_openai_chat(
+        [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ],
+        model="gpt-3.5-turbo",
+        cache=get_llm_cache(),
         max_tokens=100
     )
-    return response.choices[0].message["content"].strip()
 
 if __name__ == "__main__":
     main()
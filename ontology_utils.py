@@ -0,0 +1,482 @@
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+from urllib.parse import urljoin
+
+DATA_DIR = "data"
+INDEX_PATH = os.path.join(DATA_DIR, "ontology.idx")
+
+MAGIC = b"OIDX"
+VERSION = 1
+
+# Entity kinds, stored as bit flags
+CLASS = 1
+OBJECT_PROPERTY = 2
+DATATYPE_PROPERTY = 4
+DATATYPE = 8
+PROPERTY = OBJECT_PROPERTY | DATATYPE_PROPERTY
+
+# Label maps keys to language tags; IRI-derived and untagged labels are stored under ""
+_UNTAGGED = {"IRI-based", "undefined", None}
+
+_VOWL_CLASS_KINDS = {
+    "owl:Class": CLASS,
+    "owl:equivalentClass": CLASS,
+    "owl:Thing": CLASS,
+    "rdfs:Datatype": DATATYPE,
+    "rdfs:Literal": DATATYPE,
+}
+_VOWL_PROPERTY_KINDS = {
+    "owl:objectProperty": OBJECT_PROPERTY,
+    "owl:datatypeProperty": DATATYPE_PROPERTY,
+}
+
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+OWL = "http://www.w3.org/2002/07/owl#"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+XML_BASE = "{http://www.w3.org/XML/1998/namespace}base"
+
+_RDFXML_KINDS = {
+    f"{{{OWL}}}Class": CLASS,
+    f"{{{RDFS}}}Class": CLASS,
+    f"{{{OWL}}}ObjectProperty": OBJECT_PROPERTY,
+    f"{{{OWL}}}DatatypeProperty": DATATYPE_PROPERTY,
+    f"{{{RDFS}}}Datatype": DATATYPE,
+}
+_OWLXML_KINDS = {
+    "Class": CLASS,
+    "ObjectProperty": OBJECT_PROPERTY,
+    "DataProperty": DATATYPE_PROPERTY,
+    "Datatype": DATATYPE,
+}
+
+
+def local_name(iri: str) -> str:
+    """
+    Returns the part of an IRI after its last "#" or "/".
+    """
+    return iri[max(iri.rfind("#"), iri.rfind("/")) + 1:]
+
+
+def default_sources(data_dir: str = DATA_DIR) -> list:
+    return sorted(glob.glob(os.path.join(data_dir, "*.json")) + glob.glob(os.path.join(data_dir, "*.owl")))
+
+
+class _IndexBuilder:
+    """
+    Collects entities, labels and edges from the source files before they are written out.
+    """
+
+    def __init__(self):
+        self.kinds = {}
+        self.labels = {}
+        self.edges = {"subclass": set(), "domain": set(), "range": set()}
+
+    def add(self, iri: str, kind: int = 0, label: str | None = None, lang: str | None = None):
+        if not iri:
+            return
+        self.kinds[iri] = self.kinds.get(iri, 0) | kind
+        if label and label.strip():
+            self.labels.setdefault(iri, set()).add(("" if lang in _UNTAGGED else lang, " ".join(label.split())))
+
+    def add_edge(self, name: str, source: str, target: str):
+        if source and target:
+            self.add(source)
+            self.add(target)
+            self.edges[name].add((source, target))
+
+    def read_vowl(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        iris = {}
+        attributes = {item["id"]: item for item in data.get("classAttribute", [])}
+        for item in data.get("class", []):
+            attribute = attributes.get(item["id"], {})
+            iri = attribute.get("iri")
+            if not iri:
+                continue
+            iris[item["id"]] = iri
+            self.add(iri, _VOWL_CLASS_KINDS.get(item.get("type"), 0))
+            self._add_vowl_labels(iri, attribute.get("label"))
+        for attribute in attributes.values():
+            iri = iris.get(attribute["id"])
+            for parent in attribute.get("superClasses", []):
+                self.add_edge("subclass", iri, iris.get(parent))
+            for child in attribute.get("subClasses", []):
+                self.add_edge("subclass", iris.get(child), iri)
+
+        attributes = {item["id"]: item for item in data.get("propertyAttribute", [])}
+        for item in data.get("property", []):
+            attribute = attributes.get(item["id"], {})
+            domain, range_ = iris.get(attribute.get("domain")), iris.get(attribute.get("range"))
+            if item.get("type") == "rdfs:SubClassOf":
+                self.add_edge("subclass", domain, range_)
+                continue
+            kind = _VOWL_PROPERTY_KINDS.get(item.get("type"))
+            iri = attribute.get("iri")
+            if kind is None or not iri:
+                continue
+            self.add(iri, kind)
+            self._add_vowl_labels(iri, attribute.get("label"))
+            # VOWL puts owl:Thing in for properties without a declared domain or range
+            if domain and not domain.startswith(OWL):
+                self.add_edge("domain", iri, domain)
+            if range_ and not range_.startswith(OWL):
+                self.add_edge("range", iri, range_)
+
+    def _add_vowl_labels(self, iri: str, labels):
+        if isinstance(labels, str):
+            labels = {"": labels}
+        for lang, label in (labels or {}).items():
+            self.add(iri, label=label, lang=lang)
+
+    def read_owl(self, path: str):
+        root = ET.parse(path).getroot()
+        if root.tag == f"{{{RDF}}}RDF":
+            self._read_rdfxml(root)
+        elif root.tag == f"{{{OWL}}}Ontology":
+            self._read_owlxml(root)
+
+    def _read_rdfxml(self, root):
+        base = root.get(XML_BASE, "")
+        for element in root:
+            kind = _RDFXML_KINDS.get(element.tag)
+            about = element.get(f"{{{RDF}}}about")
+            if kind is None or about is None:
+                continue
+            iri = urljoin(base, about)
+            self.add(iri, kind)
+            for child in element:
+                resource = child.get(f"{{{RDF}}}resource")
+                if child.tag == f"{{{RDFS}}}label":
+                    self.add(iri, label=child.text, lang=child.get(XML_LANG))
+                elif resource is None:
+                    continue
+                elif child.tag == f"{{{RDFS}}}subClassOf":
+                    self.add_edge("subclass", iri, urljoin(base, resource))
+                elif child.tag == f"{{{RDFS}}}domain":
+                    self.add_edge("domain", iri, urljoin(base, resource))
+                elif child.tag == f"{{{RDFS}}}range":
+                    self.add_edge("range", iri, urljoin(base, resource))
+
+    def _read_owlxml(self, root):
+        base = root.get(XML_BASE) or root.get("ontologyIRI", "")
+        prefixes = {p.get("name"): p.get("IRI") for p in root.iter(f"{{{OWL}}}Prefix")}
+
+        def resolve(element) -> str | None:
+            if element is None:
+                return None
+            if element.get("abbreviatedIRI"):
+                prefix, _, name = element.get("abbreviatedIRI").partition(":")
+                return prefixes.get(prefix, "") + name
+            iri = element.get("IRI") or element.text
+            return urljoin(base, iri.strip()) if iri else None
+
+        def children(element) -> list:
+            return [(child.tag.rpartition("}")[2], child) for child in element]
+
+        for axiom in root:
+            tag = axiom.tag.rpartition("}")[2]
+            parts = children(axiom)
+            if tag == "Declaration" and parts and parts[0][0] in _OWLXML_KINDS:
+                self.add(resolve(parts[0][1]), _OWLXML_KINDS[parts[0][0]])
+            elif tag == "SubClassOf" and len(parts) == 2 and parts[0][0] == parts[1][0] == "Class":
+                self.add_edge("subclass", resolve(parts[0][1]), resolve(parts[1][1]))
+            elif tag in ("ObjectPropertyDomain", "DataPropertyDomain") and len(parts) == 2 and parts[1][0] == "Class":
+                self.add_edge("domain", resolve(parts[0][1]), resolve(parts[1][1]))
+            elif tag in ("ObjectPropertyRange", "DataPropertyRange") and len(parts) == 2 \
+                    and parts[1][0] in ("Class", "Datatype"):
+                self.add_edge("range", resolve(parts[0][1]), resolve(parts[1][1]))
+            elif tag == "AnnotationAssertion" and len(parts) == 3 \
+                    and resolve(parts[0][1]) == f"{RDFS}label" and parts[2][0] == "Literal":
+                self.add(resolve(parts[1][1]), label=parts[2][1].text, lang=parts[2][1].get(XML_LANG))
+
+
+def _string_table(strings: list) -> tuple[array, bytes]:
+    offsets = array("I", [0])
+    data = bytearray()
+    for s in strings:
+        data += s
+        offsets.append(len(data))
+    return offsets, bytes(data)
+
+
+def _csr(pairs, count: int) -> tuple[array, array]:
+    """
+    Packs (source id, target id) pairs into compressed sparse row arrays.
+    """
+    indptr = array("I", [0]) * (count + 1)
+    for source, _ in pairs:
+        indptr[source + 1] += 1
+    for i in range(count):
+        indptr[i + 1] += indptr[i]
+    indices = array("I", (target for _, target in sorted(pairs)))
+    return indptr, indices
+
+
+def _source_stamps(sources: list) -> dict:
+    return {path: [os.path.getmtime(path), os.path.getsize(path)] for path in sources}
+
+
+def build_index(sources: list | None = None, path: str = INDEX_PATH) -> str:
+    """
+    Compiles the VOWL JSON and OWL files in `sources` into an index file at
+    `path`. Run `python ontology_utils.py` to rebuild it by hand.
+
+    The index holds every IRI once, sorted, so an entity's id is its rank. Per
+    language it stores casefolded labels in sorted order (prefix lookups are a
+    binary search) with the id of each label's entity, and it stores the
+    subclass, domain and range relations in both directions as CSR arrays.
+    """
+    sources = default_sources() if sources is None else sources
+    builder = _IndexBuilder()
+    for source in sources:
+        if source.endswith(".json"):
+            builder.read_vowl(source)
+        elif source.endswith(".owl"):
+            builder.read_owl(source)
+
+    iris = sorted(builder.kinds)
+    ids = {iri: i for i, iri in enumerate(iris)}
+    sections = {"kinds": array("B", (builder.kinds[iri] for iri in iris))}
+    sections["iri_offsets"], sections["iri_data"] = _string_table([iri.encode("utf-8") for iri in iris])
+    display = [min((label for lang, label in builder.labels.get(iri, ()) if lang == "en"), default=local_name(iri))
+               for iri in iris]
+    sections["display_offsets"], sections["display_data"] = _string_table([d.encode("utf-8") for d in display])
+
+    by_lang = {"": {(local_name(iri).casefold(), local_name(iri), ids[iri]) for iri in iris if local_name(iri)}}
+    for iri, labels in builder.labels.items():
+        for lang, label in labels:
+            by_lang.setdefault(lang, set()).add((label.casefold(), label, ids[iri]))
+    for lang, entries in by_lang.items():
+        entries = sorted((key.encode("utf-8"), label, id_) for key, label, id_ in entries)
+        sections[f"label_key_offsets:{lang}"], sections[f"label_key_data:{lang}"] = \
+            _string_table([key for key, _, _ in entries])
+        sections[f"label_text_offsets:{lang}"], sections[f"label_text_data:{lang}"] = \
+            _string_table([label.encode("utf-8") for _, label, _ in entries])
+        sections[f"label_ids:{lang}"] = array("I", (id_ for _, _, id_ in entries))
+
+    relations = {
+        "parents": [(ids[a], ids[b]) for a, b in builder.edges["subclass"]],
+        "domain": [(ids[a], ids[b]) for a, b in builder.edges["domain"]],
+        "range": [(ids[a], ids[b]) for a, b in builder.edges["range"]],
+    }
+    relations["children"] = [(b, a) for a, b in relations["parents"]]
+    relations["domain_of"] = [(b, a) for a, b in relations["domain"]]
+    relations["range_of"] = [(b, a) for a, b in relations["range"]]
+    for name, pairs in relations.items():
+        sections[f"{name}_indptr"], sections[f"{name}_indices"] = _csr(pairs, len(iris))
+
+    # Every section starts on an 8-byte boundary so it can be cast in place
+    layout, offset = {}, 0
+    for name, section in sections.items():
+        data = section.tobytes() if isinstance(section, array) else section
+        typecode = section.typecode if isinstance(section, array) else "B"
+        layout[name] = (offset, len(data), typecode, data)
+        offset += (len(data) + 7) // 8 * 8
+    header = json.dumps({
+        "version": VERSION,
+        "byteorder": sys.byteorder,
+        "count": len(iris),
+        "languages": sorted(by_lang),
+        "sources": _source_stamps(sources),
+        "sections": {name: [start, length, typecode] for name, (start, length, typecode, _) in layout.items()},
+    }).encode("utf-8")
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % 8)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for start, length, _, data in layout.values():
+            f.write(data + b"\0" * (-length % 8))
+    os.replace(tmp_path, path)
+    return path
+
+
+class _StringTable:
+    """
+    A read-only sequence of strings stored as an offsets array plus UTF-8 data.
+    Items are returned as bytes, which sort like the strings they encode, so
+    the table can be searched with bisect without decoding.
+    """
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def text(self, i: int) -> str:
+        return self[i].decode("utf-8")
+
+
+class OntologyIndex:
+    """
+    A memory-mapped ontology index written by build_index. Nothing is copied
+    out of the file up front: lookups read the mapped pages directly, so one
+    index can be shared by every session at no extra memory cost.
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+        if view[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an ontology index")
+        header_length, = struct.unpack_from("<I", view, len(MAGIC))
+        body = len(MAGIC) + 4 + header_length
+        self.header = json.loads(view[len(MAGIC) + 4:body].tobytes())
+        if self.header["version"] != VERSION or self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was built by an incompatible version")
+
+        self._sections = {
+            name: view[body + start:body + start + length].cast(typecode)
+            for name, (start, length, typecode) in self.header["sections"].items()
+        }
+        self.languages = self.header["languages"]
+        self._kinds = self._sections["kinds"]
+        self._iris = _StringTable(self._sections["iri_offsets"], self._sections["iri_data"])
+        self._display = _StringTable(self._sections["display_offsets"], self._sections["display_data"])
+        self._label_keys = {}
+        self._label_texts = {}
+        for lang in self.languages:
+            self._label_keys[lang] = _StringTable(self._sections[f"label_key_offsets:{lang}"],
+                                                  self._sections[f"label_key_data:{lang}"])
+            self._label_texts[lang] = _StringTable(self._sections[f"label_text_offsets:{lang}"],
+                                                   self._sections[f"label_text_data:{lang}"])
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    def __contains__(self, iri: str) -> bool:
+        return self.id_of(iri) is not None
+
+    def iri(self, id_: int) -> str:
+        return self._iris.text(id_)
+
+    def id_of(self, iri: str) -> int | None:
+        key = iri.encode("utf-8")
+        i = bisect.bisect_left(self._iris, key)
+        return i if i < len(self._iris) and self._iris[i] == key else None
+
+    def kind(self, iri: str) -> int:
+        id_ = self.id_of(iri)
+        return 0 if id_ is None else self._kinds[id_]
+
+    def search(self, text: str, lang: str = "en", kinds: int = 0, limit: int = 20) -> list:
+        """
+        Returns up to `limit` (label, IRI) pairs whose label starts with `text`,
+        ignoring case. Labels in `lang` come first, then IRI local names;
+        `kinds` restricts the results to entities of those kinds.
+        """
+        key = text.casefold().encode("utf-8")
+        results, seen = [], set()
+        for language in dict.fromkeys((lang, "")):
+            keys = self._label_keys.get(language)
+            if keys is None:
+                continue
+            ids = self._sections[f"label_ids:{language}"]
+            # No UTF-8 sequence contains 0xff, so this bounds every key starting with `key`
+            end = bisect.bisect_left(keys, key + b"\xff")
+            for i in range(bisect.bisect_left(keys, key), end):
+                id_ = ids[i]
+                if id_ in seen or (kinds and not self._kinds[id_] & kinds):
+                    continue
+                seen.add(id_)
+                results.append((self._label_texts[language].text(i), self.iri(id_)))
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def label(self, iri: str) -> str:
+        """
+        Returns the English label of an entity, or its local name if it has none.
+        """
+        id_ = self.id_of(iri)
+        return local_name(iri) if id_ is None else self._display.text(id_)
+
+    def _related(self, name: str, iri: str) -> list:
+        id_ = self.id_of(iri)
+        if id_ is None:
+            return []
+        indptr, indices = self._sections[f"{name}_indptr"], self._sections[f"{name}_indices"]
+        return [self.iri(target) for target in indices[indptr[id_]:indptr[id_ + 1]]]
+
+    def parents(self, iri: str) -> list:
+        return self._related("parents", iri)
+
+    def children(self, iri: str) -> list:
+        return self._related("children", iri)
+
+    def ancestors(self, iri: str) -> list:
+        """
+        Returns the superclasses of a class, nearest first.
+        """
+        found, frontier = {}, [iri]
+        while frontier:
+            frontier = [parent for current in frontier for parent in self.parents(current)
+                        if parent not in found and parent != iri]
+            found.update(dict.fromkeys(frontier))
+        return list(found)
+
+    def domain(self, iri: str) -> list:
+        return self._related("domain", iri)
+
+    def range(self, iri: str) -> list:
+        return self._related("range", iri)
+
+    def properties_with_domain(self, iri: str) -> list:
+        return self._related("domain_of", iri)
+
+    def properties_with_range(self, iri: str) -> list:
+        return self._related("range_of", iri)
+
+    def close(self):
+        self._iris = self._display = self._label_keys = self._label_texts = self._kinds = None
+        for section in self._sections.values():
+            section.release()
+        self._sections = {}
+        self._view.release()
+        self._mmap.close()
+
+
+def load_index(path: str = INDEX_PATH, sources: list | None = None) -> OntologyIndex:
+    """
+    Maps the index at `path`, building it first if it is missing, stale
+    or was written by an incompatible version.
+    """
+    sources = default_sources() if sources is None else sources
+    if os.path.exists(path):
+        try:
+            index = OntologyIndex(path)
+            if index.header["sources"] == json.loads(json.dumps(_source_stamps(sources))):
+                return index
+            index.close()
+        except (ValueError, KeyError):
+            pass
+    build_index(sources, path)
+    return OntologyIndex(path)
+
+
+if __name__ == "__main__":
+    import time
+
+    started = time.perf_counter()
+    index_path = build_index(sys.argv[1:] or None)
+    index = OntologyIndex(index_path)
+    print(f"Wrote {index_path}: {len(index)} IRIs, {len(index.languages)} label languages, "
+          f"{os.path.getsize(index_path) / 1024:.0f} KiB in {time.perf_counter() - started:.1f}s")
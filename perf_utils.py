@@ -0,0 +1,72 @@
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+
+# Dependencies that are slow to import and only loaded when first used
+HEAVY_MODULES = ("openai", "google.generativeai", "rdflib", "SPARQLWrapper")
+
+
+def loaded_modules(names: tuple = HEAVY_MODULES) -> list:
+    """
+    Returns which of the given modules have been imported so far.
+    """
+    return [name for name in names if name in sys.modules]
+
+
+class RunTimer:
+    """
+    Times one run of the script as a sequence of named steps, each lasting
+    from the previous mark to the next.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = []
+        self._last = self.start
+
+    def mark(self, name: str):
+        now = time.perf_counter()
+        self.steps.append((name, now - self._last))
+        self._last = now
+
+    def total(self) -> float:
+        return self._last - self.start
+
+
+class TimingReport:
+    """
+    Collects the timings of script runs in this process. The first run is
+    the cold start, which pays for the first imports of every module; later
+    runs are reruns, of which the last `max_runs` are kept for the statistics.
+    """
+
+    def __init__(self, max_runs: int = 50):
+        self.cold_start = None
+        self.reruns = deque(maxlen=max_runs)
+        self._lock = threading.Lock()
+
+    def record(self, timer: RunTimer):
+        run = {"total": timer.total(), "steps": list(timer.steps)}
+        with self._lock:
+            if self.cold_start is None:
+                self.cold_start = run
+            else:
+                self.reruns.append(run)
+
+    def summary(self) -> dict:
+        """
+        Returns the cold start run, the median and worst rerun times, the
+        steps of the latest rerun and the heavy modules loaded so far.
+        """
+        with self._lock:
+            reruns = [run["total"] for run in self.reruns]
+            return {
+                "cold_start": self.cold_start,
+                "reruns": len(reruns),
+                "rerun_median": statistics.median(reruns) if reruns else None,
+                "rerun_max": max(reruns) if reruns else None,
+                "last_rerun": self.reruns[-1] if self.reruns else None,
+                "loaded_modules": loaded_modules(),
+            }
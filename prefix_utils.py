@@ -0,0 +1,120 @@
+import glob
+import json
+import os
+import threading
+
+from query_utils import declared_prefixes, undeclared_prefixes
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+# Well-known vocabularies, including the ones DBpedia and Wikidata predefine
+COMMON_PREFIXES = {
+    "dbo": "http://dbpedia.org/ontology/",
+    "dbr": "http://dbpedia.org/resource/",
+    "dbp": "http://dbpedia.org/property/",
+    "dbc": "http://dbpedia.org/resource/Category:",
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "xsd": XSD,
+    "foaf": "http://xmlns.com/foaf/0.1/",
+    "schema": "http://schema.org/",
+    "skos": "http://www.w3.org/2004/02/skos/core#",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "dct": "http://purl.org/dc/terms/",
+    "dcterms": "http://purl.org/dc/terms/",
+    "geo": "http://www.w3.org/2003/01/geo/wgs84_pos#",
+    "georss": "http://www.georss.org/georss/",
+    "prov": "http://www.w3.org/ns/prov#",
+    "void": "http://rdfs.org/ns/void#",
+    "wd": "http://www.wikidata.org/entity/",
+    "wdt": "http://www.wikidata.org/prop/direct/",
+    "wds": "http://www.wikidata.org/entity/statement/",
+    "p": "http://www.wikidata.org/prop/",
+    "ps": "http://www.wikidata.org/prop/statement/",
+    "pq": "http://www.wikidata.org/prop/qualifier/",
+    "wikibase": "http://wikiba.se/ontology#",
+    "bd": "http://www.bigdata.com/rdf#",
+    "yago": "http://dbpedia.org/class/yago/",
+}
+
+
+class PrefixRegistry:
+    """
+    Maps prefix names to namespaces so queries can be completed with the
+    PREFIX declarations they are missing before they are sent.
+    """
+
+    def __init__(self, prefixes: dict | None = None):
+        self.prefixes = dict(COMMON_PREFIXES if prefixes is None else prefixes)
+
+    def add(self, prefix: str, namespace: str, replace: bool = False):
+        if replace:
+            self.prefixes[prefix] = namespace
+        else:
+            self.prefixes.setdefault(prefix, namespace)
+
+    def add_vowl(self, path: str):
+        """
+        Adds the prefixList of a VOWL JSON file. Names already registered keep
+        their namespace, and the empty prefix is skipped since its meaning is
+        local to each file.
+        """
+        with open(path, encoding="utf-8") as f:
+            prefix_list = json.load(f).get("header", {}).get("prefixList", {})
+        for prefix, namespace in prefix_list.items():
+            if prefix:
+                self.add(prefix, namespace)
+
+    def get(self, prefix: str) -> str | None:
+        return self.prefixes.get(prefix)
+
+    def missing_declarations(self, query: str) -> tuple[dict, list]:
+        """
+        Returns the declarations the query is missing that the registry can
+        supply, and the undeclared prefixes it knows nothing about.
+        """
+        found, unknown = {}, []
+        for prefix in undeclared_prefixes(query):
+            namespace = self.prefixes.get(prefix)
+            if namespace is None:
+                unknown.append(prefix)
+            else:
+                found[prefix] = namespace
+        return found, unknown
+
+    def inject(self, query: str) -> tuple[str, list]:
+        """
+        Prepends PREFIX declarations for every undeclared prefix the registry
+        knows. Returns the query and the prefixes that were added.
+        """
+        found, _ = self.missing_declarations(query)
+        if not found:
+            return query, []
+        declarations = "".join(f"PREFIX {prefix}: <{namespace}>\n" for prefix, namespace in found.items())
+        return declarations + query, list(found)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(data_dir: str = "data") -> PrefixRegistry:
+    """
+    Returns the process-wide registry: the common vocabularies plus the
+    prefixList of every VOWL JSON file in `data_dir`.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PrefixRegistry()
+            for path in sorted(glob.glob(os.path.join(data_dir, "*.json"))):
+                _registry.add_vowl(path)
+        return _registry
+
+
+def known_prefixes(query: str = "") -> dict:
+    """
+    Returns the registry's prefixes overridden by the ones the query declares.
+    """
+    return {**get_registry().prefixes, **declared_prefixes(query)}
@@ -0,0 +1,212 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterator
+
+# One alternative per token kind; strings, IRIs and comments come first so
+# nothing inside them is mistaken for a prefixed name
+_TOKEN = re.compile(r"""
+    (?P<comment>\#[^\n]*)
+  | (?P<string>\"\"\"(?:[^"\\]|\\.|"(?!""))*(?:\"\"\"|$)
+             | '''(?:[^'\\]|\\.|'(?!''))*(?:'''|$)
+             | "(?:[^"\\\n]|\\.)*"?
+             | '(?:[^'\\\n]|\\.)*'?)
+  | (?P<iri><[^<>"{}|^`\\\s]*>)
+  | (?P<variable>[?$]\w+)
+  | (?P<bnode>_:[\w.-]*)
+  | (?P<pname>(?:[A-Za-z][\w.-]*)?:(?:[\w%-]|:|\.(?=[\w%:-]))*)
+  | (?P<word>\w+)
+  | (?P<space>\s+)
+  | (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenize(query: str) -> Iterator[tuple[str, str, int]]:
+    """
+    Splits a SPARQL query into (kind, text, offset) tokens. Kinds are
+    comment, string, iri, variable, bnode, pname (a prefixed name, or a
+    bare "prefix:" in a declaration), word, space and punct.
+    """
+    for match in _TOKEN.finditer(query):
+        yield match.lastgroup, match.group(), match.start()
+
+
+# Marks the token after a PREFIX keyword, which must be the prefix's name
+_EXPECT_NAME = object()
+
+
+def declared_prefixes(query: str) -> dict:
+    """
+    Returns the prefixes declared by PREFIX lines, mapped to their namespaces.
+    """
+    prefixes = {}
+    expecting = None
+    for kind, text, _ in tokenize(query):
+        if kind in ("space", "comment"):
+            continue
+        if kind == "word" and text.upper() == "PREFIX":
+            expecting = _EXPECT_NAME
+        elif expecting is _EXPECT_NAME and kind == "pname" and text.endswith(":"):
+            expecting = text[:-1]
+        elif expecting is not None and expecting is not _EXPECT_NAME and kind == "iri":
+            prefixes[expecting] = text[1:-1]
+            expecting = None
+        else:
+            expecting = None
+    return prefixes
+
+
+def used_prefixes(query: str) -> list:
+    """
+    Returns the prefixes of the prefixed names used in the query body, in order of first use.
+    """
+    used = {}
+    after_prefix_keyword = False
+    for kind, text, _ in tokenize(query):
+        if kind in ("space", "comment"):
+            continue
+        if kind == "pname" and not after_prefix_keyword:
+            used.setdefault(text.partition(":")[0])
+        after_prefix_keyword = kind == "word" and text.upper() == "PREFIX"
+    return list(used)
+
+
+def undeclared_prefixes(query: str) -> list:
+    """
+    Returns the prefixes used in the query but not declared by it.
+    """
+    declared = declared_prefixes(query)
+    return [prefix for prefix in used_prefixes(query) if prefix not in declared]
+
+
+_QUERY_FORMS = {"SELECT", "CONSTRUCT", "ASK", "DESCRIBE"}
+# Tokens that can follow each query form keyword when it starts a query rather than a sentence
+_FORM_FOLLOWERS = {
+    "SELECT": {"variable", "*", "(", "DISTINCT", "REDUCED"},
+    "CONSTRUCT": {"{", "WHERE", "FROM"},
+    "ASK": {"{", "WHERE", "FROM"},
+    "DESCRIBE": {"variable", "iri", "pname", "*"},
+}
+_SOLUTION_MODIFIERS = {"GROUP", "BY", "HAVING", "ORDER", "ASC", "DESC", "LIMIT", "OFFSET"}
+
+
+def fenced_block_pattern(unterminated: bool = False) -> re.Pattern:
+    """
+    Returns the regex for a Markdown fenced code block, optionally tagged
+    with a language: group 1 is the language and group 2 the body. With
+    `unterminated`, a block left open at the end of the text also matches,
+    as in a reply cut short.
+    """
+    return re.compile(r"```[ \t]*(\w*)[^\n]*\n(.*?)" + (r"(?:```|$)" if unterminated else "```"), re.DOTALL)
+
+
+_FENCED_BLOCK = fenced_block_pattern(unterminated=True)
+
+
+def _starts_query(tokens: list, i: int) -> bool:
+    kind, text, _ = tokens[i]
+    if kind != "word" or text.upper() not in _QUERY_FORMS:
+        return False
+    if i + 1 >= len(tokens):
+        return False
+    following_kind, following, _ = tokens[i + 1]
+    return following_kind in _FORM_FOLLOWERS[text.upper()] or following.upper() in _FORM_FOLLOWERS[text.upper()]
+
+
+def _query_end(tokens: list, start: int) -> int:
+    """
+    Returns the index of the token just past the query starting at `start`:
+    its WHERE group (and template, for CONSTRUCT), then any solution
+    modifiers and trailing VALUES block. Braces inside strings, IRIs and
+    comments are single tokens, so they are never counted.
+    """
+    form = tokens[start][1].upper()
+    groups_needed = 2 if form == "CONSTRUCT" and tokens[start + 1][1] == "{" else 1
+    depth, i = 0, start + 1
+    while i < len(tokens) and groups_needed:
+        kind, text, _ = tokens[i]
+        if text == "{":
+            depth += 1
+        elif text == "}":
+            depth -= 1
+            if depth == 0:
+                groups_needed -= 1
+        elif depth == 0 and form == "DESCRIBE" and kind not in ("variable", "iri", "pname") \
+                and text != "*" and text.upper() not in ("WHERE", "FROM", "NAMED"):
+            # DESCRIBE <iri> without a WHERE clause
+            return i
+        i += 1
+
+    in_modifiers = False
+    while i < len(tokens):
+        kind, text, _ = tokens[i]
+        upper = text.upper() if kind == "word" else None
+        if upper in _SOLUTION_MODIFIERS:
+            in_modifiers = True
+            i += 1
+        elif in_modifiers and (kind in ("variable", "iri", "pname") or (kind == "word" and text.isdigit())):
+            i += 1
+        elif in_modifiers and text == "(":
+            depth = 0
+            while i < len(tokens):
+                depth += {"(": 1, ")": -1}.get(tokens[i][1], 0)
+                i += 1
+                if depth == 0:
+                    break
+        elif upper == "VALUES":
+            while i < len(tokens) and tokens[i][1] != "}":
+                i += 1
+            i += 1
+        else:
+            break
+    return i
+
+
+def extract_query(text: str) -> tuple[str | None, str]:
+    """
+    Finds the first SELECT, CONSTRUCT, ASK or DESCRIBE query in a chat
+    message, looking in fenced code blocks (sparql-tagged ones first) before
+    the prose. Returns the query text, or None, and the PREFIX declarations
+    that come before it, one per line.
+    """
+    blocks = sorted(_FENCED_BLOCK.findall(text), key=lambda block: block[0].lower() != "sparql")
+    for region in [body for _, body in blocks] + [text]:
+        tokens = [token for token in tokenize(region) if token[0] not in ("space", "comment")]
+        for i in range(len(tokens)):
+            if not _starts_query(tokens, i):
+                continue
+            end = _query_end(tokens, i)
+            stop = tokens[end][2] if end < len(tokens) else len(region)
+            query = region[tokens[i][2]:stop].strip().rstrip("`").strip()
+            prefixes = [
+                region[tokens[j][2]:tokens[j + 2][2] + len(tokens[j + 2][1])]
+                for j in range(i - 2)
+                if tokens[j][0] == "word" and tokens[j][1].upper() == "PREFIX"
+                and tokens[j + 1][0] == "pname" and tokens[j + 2][0] == "iri"
+            ]
+            return query, "\n".join(prefixes)
+    return None, ""
+
+
+_extracted = OrderedDict()
+_extracted_lock = threading.Lock()
+_EXTRACTED_MAX = 4096
+
+
+def extract_message_query(message_id: str, text: str) -> tuple[str | None, str]:
+    """
+    Memoized extract_query for chat messages: each message is parsed once,
+    and again only if its text changes (e.g. while it streams in).
+    """
+    with _extracted_lock:
+        entry = _extracted.get(message_id)
+        if entry is not None and entry[0] == text:
+            _extracted.move_to_end(message_id)
+            return entry[1]
+    result = extract_query(text)
+    with _extracted_lock:
+        _extracted[message_id] = (text, result)
+        _extracted.move_to_end(message_id)
+        while len(_extracted) > _EXTRACTED_MAX:
+            _extracted.popitem(last=False)
+    return result
@@ -0,0 +1,233 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from cache_utils import normalize_query
+
+DEFAULT_SEMANTIC_CACHE_PATH = os.path.join(".cache", "semantic_queries.sqlite")
+
+# Words that say how to answer rather than what to look for
+STOPWORDS = {
+    "a", "all", "an", "and", "any", "are", "as", "at", "by", "can", "could", "display", "do", "find", "for",
+    "from", "get", "give", "i", "in", "is", "it", "list", "me", "my", "of", "on", "please", "query", "return",
+    "show", "sparql", "tell", "that", "the", "their", "them", "there", "these", "this", "to", "want", "what",
+    "which", "with", "would", "write", "you",
+}
+
+# Words that change which results answer a question, however similar the rest
+# of it is: negations, and aggregates or orderings ("count", "top", "least")
+CONSTRAINT_WORDS = {
+    "not", "no", "without", "except", "excluding", "never", "non",
+    "count", "number", "many", "total", "sum", "average", "avg", "mean", "min", "minimum", "max", "maximum",
+    "top", "bottom", "most", "least", "highest", "lowest", "largest", "smallest", "biggest", "fewest",
+    "first", "last", "oldest", "newest", "earliest", "latest", "more", "less", "fewer", "distinct",
+}
+
+_WORD = re.compile(r"\w+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def prompt_terms(prompt: str) -> list:
+    """
+    Returns the lowercased words of a prompt that carry its meaning, with a
+    trailing plural "s" dropped so "building" and "buildings" match.
+    """
+    terms = []
+    for word in _WORD.findall(prompt.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def prompt_constraints(prompt: str) -> frozenset:
+    """
+    Returns the numbers and constraint words of a prompt. Two prompts only
+    ask the same thing if these are the same: "top 10" is not "top 100",
+    "count" is not "list" and "not in Paris" is not "in Paris".
+    """
+    words = _WORD.findall(prompt.lower())
+    return frozenset([word for word in words if word in CONSTRAINT_WORDS] +
+                     [number.replace(",", "") for number in _NUMBER.findall(prompt)])
+
+
+def vectorize(prompt: str, ngram_range: tuple = (3, 5), dims: int = 1 << 20, term_weight: float = 4.0) -> dict:
+    """
+    Turns a prompt into a sparse, L2-normalized vector of hashed character
+    n-grams of its terms (each padded with spaces), plus the whole terms
+    weighted by `term_weight`. Word order doesn't matter, small spelling
+    differences only lose a few n-grams, and a different word (Paris or
+    Berlin) costs more than its shared n-grams make up for.
+    """
+    counts = defaultdict(float)
+    for term in prompt_terms(prompt):
+        counts[_hash("w:" + term, dims)] += term_weight
+        padded = f" {term} "
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                counts[_hash(padded[i:i + n], dims)] += 1.0
+    norm = math.sqrt(sum(weight * weight for weight in counts.values()))
+    return {feature: weight / norm for feature, weight in counts.items()} if norm else {}
+
+
+def _hash(text: str, dims: int) -> int:
+    # Vectors are rebuilt from the stored prompts on start, so the per-process string hash is enough
+    return hash(text) % dims
+
+
+class SemanticQueryCache:
+    """
+    Remembers the prompts whose generated query ran successfully and finds
+    the closest earlier prompt for a new one, without any network call.
+    Vectors are kept in memory with an inverted index from each n-gram to
+    the entries containing it, so a search only scores entries sharing a
+    feature with the prompt. Features so common they say little are
+    skipped, except for the prompt's `rare_features` rarest ones, and
+    entries whose prompt has the very same terms are always candidates.
+    The pairs are stored in SQLite and reloaded on start.
+    """
+
+    def __init__(self, path: str = DEFAULT_SEMANTIC_CACHE_PATH, threshold: float = 0.75,
+                 max_feature_share: float = 0.05, rare_features: int = 8):
+        self.path = path
+        self.threshold = threshold
+        self.max_feature_share = max_feature_share
+        self.rare_features = rare_features
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._vectors = {}
+        self._postings = defaultdict(list)
+        self._keys = {}
+        self._by_terms = defaultdict(set)
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pairs (
+                id INTEGER PRIMARY KEY,
+                prompt TEXT NOT NULL,
+                query TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._db.commit()
+        for row in self._db.execute("SELECT id, prompt, query, endpoint, hits FROM pairs"):
+            self._index(*row)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _terms_key(prompt: str) -> str:
+        return " ".join(prompt_terms(prompt))
+
+    @classmethod
+    def _key(cls, prompt: str, query: str, endpoint: str) -> tuple:
+        return cls._terms_key(prompt), normalize_query(query), endpoint
+
+    def _index(self, entry_id: int, prompt: str, query: str, endpoint: str, hits: int = 0):
+        vector = vectorize(prompt)
+        self._entries[entry_id] = {"id": entry_id, "prompt": prompt, "query": query, "endpoint": endpoint,
+                                   "constraints": prompt_constraints(prompt), "hits": hits}
+        self._vectors[entry_id] = vector
+        self._keys[self._key(prompt, query, endpoint)] = entry_id
+        self._by_terms[self._terms_key(prompt)].add(entry_id)
+        for feature in vector:
+            self._postings[feature].append(entry_id)
+
+    def add(self, prompt: str, query: str, endpoint: str = "") -> int:
+        """
+        Stores a prompt and the query that answered it. Adding the same pair
+        again (ignoring stopwords and whitespace) returns the existing entry.
+        """
+        key = self._key(prompt, query, endpoint)
+        with self._lock:
+            if key in self._keys:
+                return self._keys[key]
+            cursor = self._db.execute(
+                "INSERT INTO pairs (prompt, query, endpoint, created_at) VALUES (?, ?, ?, ?)",
+                (prompt, query, endpoint, time.time()),
+            )
+            self._db.commit()
+            self._index(cursor.lastrowid, prompt, query, endpoint)
+            return cursor.lastrowid
+
+    def remove(self, entry_id: int):
+        with self._lock:
+            entry = self._entries.pop(entry_id, None)
+            if entry is None:
+                return
+            self._keys.pop(self._key(entry["prompt"], entry["query"], entry["endpoint"]), None)
+            same_terms = self._by_terms[self._terms_key(entry["prompt"])]
+            same_terms.discard(entry_id)
+            if not same_terms:
+                del self._by_terms[self._terms_key(entry["prompt"])]
+            for feature in self._vectors.pop(entry_id):
+                self._postings[feature].remove(entry_id)
+            self._db.execute("DELETE FROM pairs WHERE id = ?", (entry_id,))
+            self._db.commit()
+
+    def search(self, prompt: str, k: int = 3, endpoint: str | None = None) -> list:
+        """
+        Returns up to `k` stored entries closest to the prompt, best first,
+        each with its cosine similarity as "score". Only entries with the
+        same numbers and constraint words as the prompt (see
+        prompt_constraints) are considered, and with an endpoint, only
+        queries that ran against it.
+        """
+        vector = vectorize(prompt)
+        constraints = prompt_constraints(prompt)
+        with self._lock:
+            max_postings = max(50, int(len(self._entries) * self.max_feature_share))
+            # A repeat of a stored prompt is always a candidate, however common its terms
+            repeats = self._by_terms.get(self._terms_key(prompt), set())
+            scores = dict.fromkeys(repeats, 0.0)
+            features = sorted((feature for feature in vector if feature in self._postings),
+                              key=lambda feature: len(self._postings[feature]))
+            for rank, feature in enumerate(features):
+                postings = self._postings[feature]
+                if len(postings) > max_postings and rank >= self.rare_features:
+                    break
+                for entry_id in postings:
+                    scores[entry_id] = scores.get(entry_id, 0.0) + vector[feature] * self._vectors[entry_id][feature]
+
+            scores = {entry_id: score for entry_id, score in scores.items()
+                      if self._entries[entry_id]["constraints"] == constraints
+                      and (endpoint is None or self._entries[entry_id]["endpoint"] == endpoint)}
+            # The skipped common features still count towards the exact similarity of the candidates
+            candidates = set(sorted(scores, key=scores.get, reverse=True)[:max(k * 20, 50)])
+            candidates.update(entry_id for entry_id in repeats if entry_id in scores)
+            results = []
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                stored = self._vectors[entry_id]
+                score = sum(weight * stored.get(feature, 0.0) for feature, weight in vector.items())
+                results.append({**entry, "score": score})
+        results.sort(key=lambda result: result["score"], reverse=True)
+        return results[:k]
+
+    def match(self, prompt: str, endpoint: str | None = None) -> dict | None:
+        """
+        Returns the closest stored entry if its similarity reaches the threshold, and counts the hit.
+        """
+        results = self.search(prompt, k=1, endpoint=endpoint)
+        if not results or results[0]["score"] < self.threshold:
+            return None
+        best = results[0]
+        with self._lock:
+            self._entries[best["id"]]["hits"] += 1
+            self._db.execute("UPDATE pairs SET hits = hits + 1 WHERE id = ?", (best["id"],))
+            self._db.commit()
+        return best
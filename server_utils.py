@@ -1,42 +1,233 @@
-# this is deprecated and no longer in use
+# Standalone JSON-LD server. The app does not start it: main.py stopped
+# publishing results over HTTP, and opening a port from every Streamlit
+# session is not something a deployment should get by default. It is kept
+# as a library for serving results to tools that need a URL, e.g. WebVOWL.
 
+import gzip
+import hashlib
+import re
 import threading
-from http.server import SimpleHTTPRequestHandler, HTTPServer
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
 
-class JSONHandler(SimpleHTTPRequestHandler):
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class JSONLDDocument:
+    """
+    A published JSON-LD document, encoded, gzipped and hashed once up front.
+    """
+    def __init__(self, jsonld_data: str, content_type: str = "application/ld+json"):
+        self.body = jsonld_data.encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=6)
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        # The gzipped body is a different representation, so it gets its own strong ETag
+        self.gzip_etag = self.etag[:-1] + '-gzip"'
+        self.content_type = content_type
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + len(self.gzipped)
+
+class JSONHandler(BaseHTTPRequestHandler):
     """
-    A simple HTTP handler that serves JSON content from memory.
+    Serves the documents published on the JSONLDServer.
+    "/" serves the "default" document and "/<name>" any other one.
+    Supports gzip, ETag/If-None-Match revalidation and single byte ranges.
     """
+    protocol_version = "HTTP/1.1"
+
     def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._send_common_headers()
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Range, If-None-Match")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _serve(self, send_body: bool):
+        name = unquote(urlsplit(self.path).path.strip("/")) or "default"
+        document = self.server.jsonld_server.get_document(name)
+        if document is None:
+            self._send_bytes(404, b"Not found", "text/plain", send_body)
+            return
+
+        # Ranges are served from the identity body, so they are validated against its ETag
+        range_header = self.headers.get("Range")
+        accepts_gzip = "gzip" in self.headers.get("Accept-Encoding", "") and not range_header
+        etag = document.gzip_etag if accepts_gzip else document.etag
+
+        if self._etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            self._send_common_headers(document, etag)
+            self.end_headers()
+            return
+
+        if_range = self.headers.get("If-Range")
+        if range_header and (if_range is None or if_range == document.etag):
+            self._serve_range(document, range_header, send_body)
+            return
+
+        body = document.gzipped if accepts_gzip else document.body
         self.send_response(200)
-        self.send_header("Content-type", "application/json")
+        self._send_common_headers(document, etag)
+        if accepts_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", document.content_type)
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(self.server.jsonld_data.encode())
+        if send_body:
+            self.wfile.write(body)
+
+    def _serve_range(self, document: JSONLDDocument, range_header: str, send_body: bool):
+        # Only a single range is supported; other forms get the whole document
+        match = _RANGE.match(range_header.strip())
+        total = len(document.body)
+        if not match or match.groups() == ("", ""):
+            self._send_full(document, send_body)
+            return
+
+        first, last = match.groups()
+        if first and last and int(first) > int(last):
+            # A syntactically invalid range is ignored (RFC 7233, section 2.1)
+            self._send_full(document, send_body)
+            return
+        if first == "":
+            start, end = max(0, total - int(last)), total - 1
+        else:
+            start = int(first)
+            end = min(int(last), total - 1) if last else total - 1
+        if start >= total:
+            self.send_response(416)
+            self._send_common_headers(document)
+            self.send_header("Content-Range", f"bytes */{total}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = document.body[start:end + 1]
+        self.send_response(206)
+        self._send_common_headers(document)
+        self.send_header("Content-Type", document.content_type)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_full(self, document: JSONLDDocument, send_body: bool):
+        self.send_response(200)
+        self._send_common_headers(document)
+        self.send_header("Content-Type", document.content_type)
+        self.send_header("Content-Length", str(len(document.body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(document.body)
+
+    def _send_common_headers(self, document: JSONLDDocument | None = None, etag: str | None = None):
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Expose-Headers", "ETag, Content-Range, Content-Length")
+        if document is not None:
+            self.send_header("ETag", etag or document.etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Vary", "Accept-Encoding")
+
+    def _send_bytes(self, status: int, body: bytes, content_type: str, send_body: bool):
+        self.send_response(status)
+        self._send_common_headers()
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    @staticmethod
+    def _etag_matches(header: str | None, etag: str) -> bool:
+        if not header:
+            return False
+        if header.strip() == "*":
+            return True
+        return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
 
 class JSONLDServer:
     """
-    A small wrapper around Python's HTTPServer to serve JSON-LD content.
+    A small threaded HTTP server for JSON-LD content.
+    Several named documents (e.g. one per session or per query hash) can be
+    published at once. Each one is encoded and gzipped when it is
+    published, and the least recently used ones are evicted past
+    `max_documents` or `max_bytes`.
     """
-    def __init__(self, host='localhost', port=8000):
+    def __init__(self, host='localhost', port=8000, max_documents: int = 32,
+                 max_bytes: int = 256 * 1024 * 1024):
         self.host = host
         self.port = port
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
         self.server = None
         self.thread = None
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
 
-    def start_server(self, jsonld_data: str):
+    def start_server(self, jsonld_data: str | None = None):
         """
         Start the HTTP server in a separate thread.
+        If `jsonld_data` is given it is published as the "default" document.
         """
-        def handler(*args):
-            self._JSONHandler = JSONHandler
-            self._JSONHandler.server = self.server
-            self.server.jsonld_data = jsonld_data
-            JSONHandler(*args)
+        if jsonld_data is not None:
+            self.publish(jsonld_data, name="default")
+        if self.server is not None:
+            return
 
-        self.server = HTTPServer((self.host, self.port), handler)
+        self.server = ThreadingHTTPServer((self.host, self.port), JSONHandler)
+        self.server.daemon_threads = True
+        self.server.jsonld_server = self
         self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
         self.thread.start()
 
+    def publish(self, jsonld_data: str, name: str | None = None) -> str:
+        """
+        Publishes a document and returns its name, which is also its URL path.
+        Without a name the document is named after the hash of its content.
+        """
+        document = JSONLDDocument(jsonld_data)
+        if name is None:
+            name = document.etag.strip('"')[:16]
+        with self._lock:
+            self._documents.pop(name, None)
+            self._documents[name] = document
+            self._evict()
+        return name
+
+    def remove(self, name: str):
+        with self._lock:
+            self._documents.pop(name, None)
+
+    def get_document(self, name: str) -> JSONLDDocument | None:
+        with self._lock:
+            document = self._documents.get(name)
+            if document is not None:
+                self._documents.move_to_end(name)
+            return document
+
+    def url_for(self, name: str = "default") -> str:
+        return f"http://{self.host}:{self.port}/{name}"
+
+    def _evict(self):
+        total = sum(document.size for document in self._documents.values())
+        while self._documents and (len(self._documents) > self.max_documents or total > self.max_bytes):
+            _, evicted = self._documents.popitem(last=False)
+            total -= evicted.size
+
     def stop_server(self):
         """
         Stop the server if it's running.
@@ -1,52 +1,393 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import numpy as np
 import pandas as pd
-from rdflib import Graph, URIRef, Literal
-from SPARQLWrapper import SPARQLWrapper, JSON
 
-def run_sparql_query(query: str, endpoint: str) -> pd.DataFrame:
+from http_utils import get_transport
+from prefix_utils import COMMON_PREFIXES, XSD
+from stream_utils import SPARQLResultStream
+
+_QUERY_FORM = re.compile(r"^\s*(?:(?:PREFIX\s+[\w.-]*:\s*<[^>]*>|BASE\s*<[^>]*>|#[^\n]*)\s*)*(SELECT|CONSTRUCT|ASK|DESCRIBE)\b",
+                         re.IGNORECASE)
+_TRAILING_LIMIT_OFFSET = re.compile(r"(?:\s*(?:LIMIT|OFFSET)\s+\d+)+\s*$", re.IGNORECASE)
+_LIMIT = re.compile(r"LIMIT\s+(\d+)", re.IGNORECASE)
+_OFFSET = re.compile(r"OFFSET\s+(\d+)", re.IGNORECASE)
+_DIRECTIVE = re.compile(rb"@?(?:PREFIX|BASE)\b", re.IGNORECASE)
+
+def run_sparql_query(query: str, endpoint: str, result_format: str = "json",
+                     batch_size: int = 5000, timeout: float | None = None,
+                     on_connection=None, on_response=None, on_chunk=None) -> pd.DataFrame:
     """
     Executes a SPARQL query against a specified endpoint 
     and returns results in a pandas DataFrame.
+    The request goes through the shared pooled transport, and the response
+    body is parsed as it is read, `batch_size` rows at a time, in whichever
+    of the JSON, TSV or CSV result formats the endpoint sends.
+    `on_connection` receives the connection while the endpoint has not
+    answered yet, `on_response` the open response (either can be aborted
+    from another thread) and `on_chunk` the size of every chunk received.
+    """
+    transport = get_transport()
+    response = transport.open_query(endpoint, query, result_format, timeout=timeout, on_connection=on_connection)
+    if on_response is not None:
+        on_response(response)
+    try:
+        chunks = transport.iter_chunks(response, on_chunk=on_chunk)
+        stream = SPARQLResultStream(chunks, response.headers.get("Content-Type"), batch_size)
+        return stream_to_dataframe(stream)
+    finally:
+        response.close()
+
+def count_triples(query: str, endpoint: str, timeout: float | None = None,
+                  on_connection=None) -> int:
+    """
+    Runs a CONSTRUCT or DESCRIBE query and returns the number of triples in
+    the graph it sends back, asking for N-Triples. Should the endpoint answer
+    with Turtle instead, every statement line is counted, which is close enough
+    to tell an empty graph from a non-empty one.
+    """
+    transport = get_transport()
+    response = transport.open_query(endpoint, query, "ntriples", timeout=timeout, on_connection=on_connection)
+    try:
+        count = 0
+        pending = b""
+        for chunk in transport.iter_chunks(response):
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            count += sum(1 for line in lines if _is_statement(line))
+        return count + _is_statement(pending)
+    finally:
+        response.close()
+
+def _is_statement(line: bytes) -> bool:
+    line = line.strip()
+    return bool(line) and not line.startswith(b"#") and not _DIRECTIVE.match(line)
+
+def stream_to_dataframe(stream: SPARQLResultStream) -> pd.DataFrame:
+    """
+    Builds a DataFrame from a SPARQLResultStream one batch at a time, so the
+    parsed bindings of only a single batch are alive at once.
+    """
+    frames = [bindings_to_dataframe(stream.variables or _batch_variables(batch), batch) for batch in stream]
+    if stream.boolean is not None:
+        return pd.DataFrame({"boolean": [stream.boolean]})
+    if not frames:
+        return bindings_to_dataframe(stream.variables or [], [])
+    return concat_frames(frames)
+
+def _batch_variables(batch: list) -> list:
+    variables = {}
+    for binding in batch:
+        variables.update(dict.fromkeys(binding))
+    return list(variables)
+
+def concat_frames(frames: list) -> pd.DataFrame:
+    """
+    Concatenates result frames, keeping categorical columns categorical
+    even when the frames have different categories.
+    """
+    if len(frames) == 1:
+        return frames[0]
+
+    columns = list(dict.fromkeys(column for frame in frames for column in frame.columns))
+    categorical = {
+        column for column in columns
+        if all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames if column in frame)
+    }
+    df = pd.concat(frames, ignore_index=True)
+    for column in categorical:
+        df[column] = df[column].astype("category")
+    return df[columns]
+
+def split_limit_offset(query: str) -> tuple[str, int | None, int]:
+    """
+    Splits the trailing LIMIT/OFFSET clauses off a query.
+    Returns the query without them, the LIMIT (or None) and the OFFSET (or 0).
+    """
+    match = _TRAILING_LIMIT_OFFSET.search(query)
+    if not match or "}" not in query[:match.start()]:
+        return query.rstrip(), None, 0
+    modifiers = match.group(0)
+    limit = _LIMIT.search(modifiers)
+    offset = _OFFSET.search(modifiers)
+    return (query[:match.start()].rstrip(),
+            int(limit.group(1)) if limit else None,
+            int(offset.group(1)) if offset else 0)
+
+def paginate_query(query: str, limit: int, offset: int = 0) -> str:
+    """
+    Rewrites a SELECT query to fetch a single LIMIT/OFFSET page.
+    The query's own ORDER BY is kept, which is what makes pages stable;
+    without one the endpoint is free to return rows in any order.
+    """
+    form = _QUERY_FORM.match(query)
+    if not form or form.group(1).upper() != "SELECT":
+        raise ValueError("Only SELECT queries can be paginated.")
+    base, _, _ = split_limit_offset(query)
+    page = f"{base}\nLIMIT {limit}"
+    if offset:
+        page += f" OFFSET {offset}"
+    return page
+
+def iter_query_pages(query: str, endpoint: str, page_size: int = 1000,
+                     max_rows: int | None = None, max_workers: int = 1,
+                     result_format: str = "json", **request_options) -> Iterator[pd.DataFrame]:
+    """
+    Executes a SELECT query page by page and yields each page as a DataFrame.
+    A LIMIT/OFFSET already on the query bounds the pages, and `max_rows`
+    caps the total. With `max_workers` > 1 that many pages are requested
+    at once, but pages are still yielded in order. Queries other than
+    SELECT are run in a single request. Extra keyword arguments are passed
+    on to run_sparql_query.
+    """
+    form = _QUERY_FORM.match(query)
+    if not form or form.group(1).upper() != "SELECT":
+        yield run_sparql_query(query, endpoint, result_format, **request_options)
+        return
+
+    base, limit, offset = split_limit_offset(query)
+    if limit is not None:
+        max_rows = limit if max_rows is None else min(limit, max_rows)
+
+    fetched = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while max_rows is None or fetched < max_rows:
+            window = []
+            for i in range(max(1, max_workers)):
+                start = fetched + i * page_size
+                if max_rows is not None and start >= max_rows:
+                    break
+                size = page_size if max_rows is None else min(page_size, max_rows - start)
+                window.append((size, executor.submit(
+                    run_sparql_query, paginate_query(base, size, offset + start), endpoint, result_format,
+                    **request_options)))
+
+            for size, future in window:
+                page = future.result()
+                fetched += len(page)
+                if not page.empty:
+                    yield page
+                if len(page) < size:
+                    for _, pending in window:
+                        pending.cancel()
+                    return
+
+def process_query_results(results: dict) -> pd.DataFrame:
+    """
+    Converts SPARQL JSON results into a typed DataFrame.
+    ASK results become a single "boolean" column.
+    """
+    if "boolean" in results:
+        return pd.DataFrame({"boolean": [bool(results["boolean"])]})
+    return bindings_to_dataframe(results["head"]["vars"], results["results"]["bindings"])
+
+def bindings_to_dataframe(variables: list, bindings) -> pd.DataFrame:
+    """
+    Builds a DataFrame column by column from SPARQL JSON bindings.
+    Terms are gathered into one array per variable and converted using the
+    RDF term metadata: xsd numeric, boolean and date/time literals get native
+    dtypes, IRI-only columns become categoricals, and language tags are kept
+    in a companion "<var>_lang" column.
+    """
+    if not isinstance(bindings, list):
+        bindings = list(bindings)
+
+    frame = {}
+    for var in variables:
+        frame[var], langs = _build_column([binding.get(var) for binding in bindings])
+        if langs is not None:
+            frame[f"{var}_lang"] = langs
+    return pd.DataFrame(frame, index=pd.RangeIndex(len(bindings)))
+
+def _build_column(terms: list) -> tuple[pd.Series, pd.Series | None]:
     """
-    sparql = SPARQLWrapper(endpoint)
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
+    Converts the RDF terms bound to one variable (None where unbound) into a
+    typed Series, plus a Series of language tags if any literal carries one.
+    """
+    values = pd.Series([term["value"] if term else None for term in terms], dtype=object)
+    kinds = {(term["type"], term.get("datatype"), "xml:lang" in term) for term in terms if term}
+    if not kinds:
+        return values, None
+
+    if any(has_lang for _, _, has_lang in kinds):
+        langs = pd.Series([term.get("xml:lang") if term else None for term in terms], dtype="category")
+        return values, langs
 
-    results = sparql.query().convert()
-    data = process_query_results(results)
-    columns = results["head"]["vars"]
-    df = pd.DataFrame(data, columns=columns)
-    return df
+    term_types = {term_type for term_type, _, _ in kinds}
+    if term_types == {"uri"}:
+        return values.astype("category"), None
+    if term_types <= {"literal", "typed-literal"}:
+        datatypes = {datatype for _, datatype, _ in kinds}
+        return _convert_literals(values, datatypes, None not in terms), None
+    return values, None
 
-def process_query_results(results: dict) -> list:
+_INTEGER_TYPES = {XSD + t for t in (
+    "integer", "int", "long", "short", "byte", "nonNegativeInteger", "nonPositiveInteger",
+    "positiveInteger", "negativeInteger", "unsignedLong", "unsignedInt", "unsignedShort", "unsignedByte"
+)}
+_FLOAT_TYPES = {XSD + t for t in ("decimal", "double", "float")}
+_DATETIME_TYPES = {XSD + t for t in ("dateTime", "dateTimeStamp", "date")}
+
+def _convert_literals(values: pd.Series, datatypes: set, complete: bool) -> pd.Series:
     """
-    Converts SPARQL JSON results into a list of dictionaries.
+    Converts a column of literal lexical forms to the dtype matching its xsd datatypes.
+    Columns that mix unrelated datatypes or hold values that do not parse are left as strings.
     """
-    data = []
-    for result in results["results"]["bindings"]:
-        row = {}
-        for var in result:
-            row[var] = result[var]["value"]
-        data.append(row)
-    return data
+    try:
+        if datatypes <= _INTEGER_TYPES:
+            if complete:
+                return values.astype("int64")
+            return pd.to_numeric(values).astype("Int64")
+        if datatypes <= _INTEGER_TYPES | _FLOAT_TYPES:
+            return pd.to_numeric(values).astype("float64")
+        if datatypes == {XSD + "boolean"}:
+            lowered = values.str.strip().str.lower()
+            if not lowered.dropna().isin(["true", "false", "1", "0"]).all():
+                return values
+            converted = lowered.isin(["true", "1"])
+            return converted if complete else converted.astype("boolean").mask(values.isna())
+        if datatypes <= _DATETIME_TYPES:
+            converted = pd.to_datetime(values, errors="coerce", utc=True, format="ISO8601")
+            return values if converted.isna().sum() > values.isna().sum() else converted
+    except (ValueError, TypeError, OverflowError):
+        return values
+    return values
+
+# The prefixes JSON-LD exports may compact IRIs with; "ex" names the result columns
+JSONLD_PREFIXES = {"ex": "http://example.org/", **COMMON_PREFIXES}
+_IRI_PATTERN = r"^(?:https?|urn|ftp|mailto):"
 
-def convert_to_jsonld(df: pd.DataFrame) -> str:
+def convert_to_jsonld(df: pd.DataFrame, subject_column: str | None = None, indent: int | None = 4) -> str:
     """
     Converts the DataFrame SPARQL results into JSON-LD format.
     """
-    graph = Graph()
-    for _, row in df.iterrows():
-        if 'building' in df.columns:
-            subject_uri = URIRef(row['building'])
-        else:
-            subject_uri = Literal(row.iloc[0])
+    return "".join(iter_jsonld(df, subject_column=subject_column, indent=indent))
 
-        for col in df.columns:
-            predicate_uri = URIRef(f"http://example.org/{col}")
-            if str(row[col]).startswith("http"):
-                object_val = URIRef(row[col])
-            else:
-                object_val = Literal(row[col])
+def iter_jsonld(df: pd.DataFrame, subject_column: str | None = None, chunk_size: int = 5000,
+                indent: int | None = None) -> Iterator[str]:
+    """
+    Serializes a result DataFrame as a JSON-LD document piece by piece,
+    `chunk_size` rows at a time, without building an rdflib Graph.
 
-            graph.add((subject_uri, predicate_uri, object_val))
+    Each row becomes a node whose @id comes from `subject_column` (by
+    default "building" if present, else the first all-IRI column, else a
+    blank node per row), and every other column becomes a property in the
+    http://example.org/ namespace. IRI and literal values are told apart
+    per column in bulk. All-IRI columns are coerced to @id in the @context
+    and written as compact IRIs. Language tags from "<var>_lang" columns
+    and native numeric, boolean and date/time dtypes carry over to the
+    literals. The @context lists only the prefixes that are used.
+    """
+    subject_column = _jsonld_subject_column(df, subject_column)
+    lang_columns = {f"{column}_lang": column for column in df.columns if f"{column}_lang" in df.columns}
+    properties = [column for column in df.columns if column != subject_column and column not in lang_columns]
+
+    context = {"ex": JSONLD_PREFIXES["ex"]}
+    encoded = []
+    for column in properties:
+        langs = df[f"{column}_lang"] if f"{column}_lang" in lang_columns else None
+        values, is_iri = _jsonld_values(df[column], langs, context)
+        term = str(column) if str(column) not in JSONLD_PREFIXES else f"ex:{column}"
+        context[term] = {"@id": f"ex:{column}", "@type": "@id"} if is_iri else f"ex:{column}"
+        encoded.append((json.dumps(term) + ": ", values))
+
+    if subject_column is not None:
+        subjects, _ = _jsonld_values(df[subject_column], None, context, force_iri=True)
+    else:
+        subjects = pd.Series([json.dumps(f"_:b{i}") for i in range(len(df))], index=df.index, dtype=object)
+
+    # Prefixes first, then the property terms
+    ordered_context = {prefix: context.pop(prefix) for prefix in JSONLD_PREFIXES if prefix in context}
+    ordered_context.update(context)
+    separator = "\n" + " " * indent if indent is not None else " "
+    yield '{"@context": ' + json.dumps(ordered_context, indent=indent) + ', "@graph": [' + separator
 
-    return graph.serialize(format='json-ld', indent=4)
+    for start in range(0, len(df), chunk_size):
+        stop = start + chunk_size
+        columns = [(key, values.iloc[start:stop].tolist()) for key, values in encoded]
+        nodes = []
+        for i, subject in enumerate(subjects.iloc[start:stop].tolist()):
+            fields = ['"@id": ' + (subject if subject is not None else json.dumps(f"_:b{start + i}"))]
+            fields.extend(key + values[i] for key, values in columns if values[i] is not None)
+            nodes.append("{" + ", ".join(fields) + "}")
+        yield ("," + separator).join(nodes)
+        if stop < len(df):
+            yield "," + separator
+    yield ("\n" if indent is not None else "") + "]}"
+
+def _jsonld_subject_column(df: pd.DataFrame, subject_column: str | None) -> str | None:
+    if subject_column is not None:
+        return subject_column
+    if "building" in df.columns:
+        return "building"
+    for column in df.columns:
+        values = df[column]
+        if len(values) and values.notna().all() and values.astype(str).str.match(_IRI_PATTERN).all():
+            return column
+    return None
+
+def _jsonld_values(series: pd.Series, langs: pd.Series | None, context: dict,
+                   force_iri: bool = False) -> tuple[pd.Series, bool]:
+    """
+    Encodes a column as a Series of JSON fragments (None where unbound) and
+    tells whether the whole column holds IRIs. Prefixes used for compact
+    IRIs and datatypes are added to `context`.
+    """
+    missing = series.isna()
+    kind = series.dtype.kind
+
+    if kind == "b":
+        values = series.map({True: "true", False: "false"})
+    elif kind in "iuf":
+        values = series.astype(str)
+        if kind == "f":
+            # JSON has no infinity; write it as the xsd:double lexical form
+            infinite = np.isinf(series.to_numpy(dtype=float, na_value=np.nan))
+            if infinite.any():
+                values = values.where(~infinite, np.where(series > 0, '{"@value": "INF", "@type": "xsd:double"}',
+                                                          '{"@value": "-INF", "@type": "xsd:double"}'))
+                context["xsd"] = XSD
+    elif kind == "M":
+        iso = series.map(lambda value: value.isoformat(), na_action="ignore")
+        values = '{"@value": ' + iso.map(json.dumps, na_action="ignore") + ', "@type": "xsd:dateTime"}'
+        context["xsd"] = XSD
+    else:
+        # Strings are classified and encoded once per distinct value
+        codes, uniques = pd.factorize(series.astype(object))
+        texts = [str(value) for value in uniques]
+        is_iri = [bool(_IRI_REGEX.match(text)) for text in texts]
+        column_is_iri = force_iri or (bool(texts) and all(is_iri))
+        quoted = [json.dumps(text) for text in texts]
+        fragments = [
+            json.dumps(_compact_iri(text, context)) if column_is_iri
+            else '{"@id": ' + quoted[i] + "}" if is_iri[i]
+            else quoted[i]
+            for i, text in enumerate(texts)
+        ]
+        # codes is -1 where unbound, which picks the trailing None
+        values = np.array(fragments + [None], dtype=object)[codes]
+        if langs is not None and not column_is_iri:
+            language = langs.astype(object).tolist()
+            for row in np.flatnonzero((langs.notna() & ~missing).to_numpy()):
+                code = codes[row]
+                if not is_iri[code]:
+                    values[row] = '{"@value": ' + quoted[code] + ', "@language": ' + json.dumps(language[row]) + "}"
+        return pd.Series(values, index=series.index, dtype=object), column_is_iri
+    return values.astype(object).where(~missing, None), False
+
+_IRI_REGEX = re.compile(_IRI_PATTERN)
+_JSONLD_NAMESPACES = {namespace: prefix for prefix, namespace in JSONLD_PREFIXES.items() if prefix != "ex"}
+
+def _compact_iri(iri: str, context: dict) -> str:
+    """
+    Shortens an IRI with a known prefix, adding the prefix used to `context`.
+    """
+    cut = max(iri.rfind("/"), iri.rfind("#")) + 1
+    prefix = _JSONLD_NAMESPACES.get(iri[:cut])
+    if prefix is None or cut == len(iri):
+        return iri
+    context[prefix] = iri[:cut]
+    return f"{prefix}:{iri[cut:]}"
@@ -0,0 +1,290 @@
+import codecs
+import csv
+import json
+import re
+from typing import Iterable, Iterator
+
+from prefix_utils import XSD
+
+JSON_CONTENT_TYPES = ("application/sparql-results+json", "application/json")
+TSV_CONTENT_TYPES = ("text/tab-separated-values",)
+CSV_CONTENT_TYPES = ("text/csv",)
+
+_TSV_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+_TSV_LITERAL = re.compile(r'^"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<([^>]*)>)?$', re.DOTALL)
+_TSV_LONG_LITERAL = re.compile(r'^"""(.*)"""(?:@([A-Za-z0-9-]+)|\^\^<([^>]*)>)?$', re.DOTALL)
+_TSV_INTEGER = re.compile(r"^[+-]?\d+$")
+_TSV_DECIMAL = re.compile(r"^[+-]?\d*\.\d+$")
+_TSV_DOUBLE = re.compile(r"^[+-]?(?:\d+\.\d*|\.?\d+)[eE][+-]?\d+$")
+_ABSOLUTE_IRI = re.compile(r"^(?:[A-Za-z][A-Za-z0-9+.-]*://|urn:|mailto:)[^\s<>\"]*$")
+
+
+class SPARQLResultStream:
+    """
+    Reads a SPARQL SELECT/ASK result body incrementally from an iterable of
+    byte chunks and yields the bindings in batches. Bindings use the SPARQL
+    JSON term layout ({"type": ..., "value": ..., ...}) whatever the wire
+    format, so JSON, TSV and CSV bodies can all feed the same DataFrame
+    builder. Only one batch of parsed rows is held in memory at a time.
+
+    `variables` is filled in from the result header as soon as it has been
+    read, and `boolean` holds the answer to an ASK query.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], content_type: str | None, batch_size: int = 1000):
+        self.chunks = chunks
+        self.content_type = (content_type or "").split(";")[0].strip().lower()
+        self.batch_size = batch_size
+        self.variables = None
+        self.boolean = None
+
+    def __iter__(self) -> Iterator[list]:
+        if self.content_type in JSON_CONTENT_TYPES:
+            return self._iter_json()
+        if self.content_type in TSV_CONTENT_TYPES:
+            return self._iter_tsv()
+        if self.content_type in CSV_CONTENT_TYPES:
+            return self._iter_csv()
+        raise ValueError(f"Unsupported SPARQL result format: {self.content_type or 'unknown'}")
+
+    def _iter_json(self) -> Iterator[list]:
+        reader = _JSONReader(self.chunks)
+        reader.expect("{")
+        while not reader.consume("}"):
+            key = reader.read_value()
+            reader.expect(":")
+            if key == "head":
+                head = reader.read_value()
+                self.variables = head.get("vars", [])
+            elif key == "boolean":
+                self.boolean = bool(reader.read_value())
+            elif key == "results":
+                reader.expect("{")
+                while not reader.consume("}"):
+                    results_key = reader.read_value()
+                    reader.expect(":")
+                    if results_key == "bindings":
+                        yield from self._iter_json_bindings(reader)
+                    else:
+                        reader.read_value()
+                    reader.consume(",")
+            else:
+                reader.read_value()
+            reader.consume(",")
+
+    def _iter_json_bindings(self, reader) -> Iterator[list]:
+        batch = []
+        for items in reader.iter_array():
+            batch.extend(items)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _iter_tsv(self) -> Iterator[list]:
+        lines = _iter_lines(self.chunks)
+        header = next(lines, None)
+        if header is None:
+            self.variables = []
+            return
+        self.variables = [name.strip().lstrip("?$") for name in header.rstrip("\r\n").split("\t")]
+
+        batch = []
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            binding = {}
+            for var, field in zip(self.variables, line.split("\t")):
+                if field:
+                    binding[var] = _parse_tsv_term(field)
+            batch.append(binding)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _iter_csv(self) -> Iterator[list]:
+        rows = csv.reader(_iter_lines(self.chunks))
+        header = next(rows, None)
+        if header is None:
+            self.variables = []
+            return
+        self.variables = [name.strip() for name in header]
+
+        batch = []
+        for row in rows:
+            if not row:
+                continue
+            binding = {}
+            for var, field in zip(self.variables, row):
+                if field:
+                    binding[var] = _parse_csv_term(field)
+            batch.append(binding)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class _JSONReader:
+    """
+    A pull parser over a chunked JSON document. Only the structural tokens
+    needed to reach the bindings array are handled here; every value below
+    that level is decoded whole with json.JSONDecoder.raw_decode.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._buffer += self._decoder.decode(b"", final=True)
+            self._eof = True
+            return True
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(chunk)
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def consume(self, token: str) -> bool:
+        if self._peek() == token:
+            self._pos += 1
+            return True
+        return False
+
+    def expect(self, token: str):
+        if not self.consume(token):
+            found = self._peek() or "end of input"
+            raise ValueError(f"Malformed SPARQL JSON results: expected '{token}', found '{found}'")
+
+    def iter_array(self) -> Iterator[list]:
+        """
+        Yields the items of the array of objects at the current position,
+        in lists of however many complete items are buffered.
+        """
+        self.expect("[")
+        while not self.consume("]"):
+            items = self._decode_buffered_items()
+            if items is None:
+                items = [self.read_value()]
+                self.consume(",")
+            yield items
+
+    def _decode_buffered_items(self) -> list | None:
+        # Bindings end in "}}" (the last term, then the binding itself), so
+        # decoding up to the last "}}," in the buffer parses every complete
+        # binding with a single C-level json call. A cut that falls inside a
+        # string leaves the decoder with an unterminated string and fails.
+        cut = self._buffer.rfind("}},", self._pos)
+        if cut == -1:
+            return None
+        try:
+            items = self._json.decode("[" + self._buffer[self._pos:cut + 2] + "]")
+        except json.JSONDecodeError:
+            return None
+        self._pos = cut + 3
+        return items
+
+    def read_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and not self._eof and not isinstance(value, (dict, list, str)):
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+
+def _iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Decodes byte chunks as UTF-8 and yields complete lines, newline included.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+    return re.sub(r"\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)",
+                  lambda m: chr(int(m.group(1)[1:], 16)) if m.group(1)[0] in "uU" and len(m.group(1)) > 1
+                  else _TSV_ESCAPES.get(m.group(1), m.group(1)),
+                  text)
+
+
+def _parse_tsv_term(field: str) -> dict:
+    """
+    Parses one TSV field (an RDF term in Turtle syntax) into a SPARQL JSON term.
+    """
+    if field.startswith("<") and field.endswith(">"):
+        return {"type": "uri", "value": _unescape(field[1:-1])}
+    if field.startswith("_:"):
+        return {"type": "bnode", "value": field[2:]}
+
+    match = _TSV_LONG_LITERAL.match(field) if field.startswith('"""') else None
+    match = match or _TSV_LITERAL.match(field)
+    if match:
+        term = {"type": "literal", "value": _unescape(match.group(1))}
+        if match.group(2):
+            term["xml:lang"] = match.group(2)
+        elif match.group(3):
+            term["datatype"] = match.group(3)
+        return term
+
+    if _TSV_INTEGER.match(field):
+        return {"type": "literal", "datatype": XSD + "integer", "value": field}
+    if _TSV_DECIMAL.match(field):
+        return {"type": "literal", "datatype": XSD + "decimal", "value": field}
+    if _TSV_DOUBLE.match(field):
+        return {"type": "literal", "datatype": XSD + "double", "value": field}
+    if field in ("true", "false"):
+        return {"type": "literal", "datatype": XSD + "boolean", "value": field}
+    return {"type": "literal", "value": field}
+
+
+def _parse_csv_term(field: str) -> dict:
+    """
+    Parses one CSV field. CSV results carry no term types, so absolute IRIs
+    and blank node labels are recognised by their shape and everything else
+    is a plain literal.
+    """
+    if field.startswith("_:"):
+        return {"type": "bnode", "value": field[2:]}
+    if _ABSOLUTE_IRI.match(field):
+        return {"type": "uri", "value": field}
+    return {"type": "literal", "value": field}
@@ -0,0 +1,181 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from analysis_utils import RDF_TYPE, Filter, Optional, QueryParseError, Triple, Union, parse_query, walk_groups
+from cache_utils import normalize_query
+
+_LANGUAGES = {
+    "en": "English", "de": "German", "fr": "French", "es": "Spanish", "it": "Italian", "nl": "Dutch",
+    "pt": "Portuguese", "ru": "Russian", "ja": "Japanese", "zh": "Chinese", "ar": "Arabic", "pl": "Polish",
+}
+
+
+def _local_name(term: str) -> str:
+    term = term.strip("<>")
+    return term[max(term.rfind("#"), term.rfind("/"), term.rfind(":")) + 1:] or term
+
+
+def _plural(count: int, word: str) -> str:
+    return f"{count} {word}" if count == 1 else f"{count} {word}s"
+
+
+def _join(items: list) -> str:
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def describe_query(query: str) -> dict:
+    """
+    Picks out what a query is about without sending it anywhere: its form,
+    projected variables, aggregates, rdf:type constraints, filters (and the
+    languages they pin), optional patterns, ordering, limit and offset.
+    A query the analysis parser does not understand is described as a
+    plain SPARQL query.
+    """
+    info = {"form": None, "distinct": False, "variables": [], "aggregates": [], "types": [], "filters": 0,
+            "languages": [], "optional": 0, "union": 0, "order_by": [], "limit": None, "offset": None}
+    try:
+        tree = parse_query(query)
+    except QueryParseError:
+        return info
+
+    info.update(form=tree.form, distinct=tree.distinct, aggregates=tree.aggregates, limit=tree.limit,
+                offset=tree.offset,
+                order_by=[variable + (" (descending)" if descending else "") for variable, descending in tree.order_by])
+    if tree.form == "SELECT":
+        info["variables"] = tree.projection
+    for group in walk_groups(tree.where) if tree.where is not None else ():
+        for element in group.elements:
+            if isinstance(element, Triple):
+                if element.predicate in (("const", RDF_TYPE), ("const", "rdf:type")) and element.object[0] == "const":
+                    info["types"].append(_local_name(element.object[1]))
+            elif isinstance(element, Filter):
+                info["filters"] += 1
+                for kind, text in element.tokens:
+                    value = text.strip("\"'").lower()
+                    if kind == "string" and (value in _LANGUAGES or (len(value) == 2 and value.isalpha())):
+                        info["languages"].append(_LANGUAGES.get(value, value))
+            elif type(element) is Optional:
+                info["optional"] += 1
+            elif isinstance(element, Union):
+                info["union"] += len(element.groups) - 1
+
+    info["types"] = list(dict.fromkeys(info["types"]))
+    info["languages"] = list(dict.fromkeys(info["languages"]))
+    return info
+
+
+def summarize_query(query: str) -> str:
+    """
+    Builds a one-line description of a query for the success banner, in a
+    few milliseconds and without an LLM call.
+    """
+    info = describe_query(query)
+    form = info["form"] or "SPARQL"
+    about = f" about {_join(info['types'])}" if info["types"] else ""
+    sentence = f"{form} query{about} ran successfully!"
+
+    details = []
+    if info["form"] == "SELECT" and info["variables"]:
+        if "*" in info["variables"]:
+            details.append("Returns all variables" + (" (distinct rows)" if info["distinct"] else ""))
+        else:
+            details.append(f"Returns {'distinct ' if info['distinct'] else ''}{_join(info['variables'])}")
+    if info["aggregates"]:
+        details.append("aggregated with " + _join(list(dict.fromkeys(info["aggregates"]))))
+    if info["filters"]:
+        languages = f" ({_join(info['languages'])} only)" if info["languages"] else ""
+        details.append(_plural(info["filters"], "filter") + languages)
+    if info["optional"]:
+        details.append(_plural(info["optional"], "optional pattern"))
+    if info["union"]:
+        details.append(_plural(info["union"], "union"))
+    if info["order_by"]:
+        details.append("ordered by " + _join(info["order_by"]))
+    if info["limit"] is not None:
+        details.append(f"limited to {_plural(info['limit'], 'row')}")
+    if info["offset"]:
+        details.append(f"starting after row {info['offset']}")
+    return sentence + (" " + ", ".join(details) + "." if details else "")
+
+
+class LLMSummaryCache:
+    """
+    Fetches LLM-written query summaries on a background thread and caches
+    them by the hash of the normalized query, so asking for a summary never
+    blocks the page and each query is only summarized once. A failed request
+    is remembered for `retry_after` seconds and then tried again, so a
+    transient API error doesn't disable the summary of a query for good.
+    """
+
+    def __init__(self, generate: Callable[[str], str], max_entries: int = 256, max_workers: int = 2,
+                 retry_after: float = 60):
+        self.generate = generate
+        self.max_entries = max_entries
+        self.retry_after = retry_after
+        self._summaries = OrderedDict()
+        self._errors = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-summary")
+
+    @staticmethod
+    def key(query: str) -> str:
+        return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+    def get(self, query: str) -> str | None:
+        with self._lock:
+            return self._summaries.get(self.key(query))
+
+    def _recent_error(self, key: str) -> str | None:
+        failed = self._errors.get(key)
+        if failed is None:
+            return None
+        if time.monotonic() - failed[0] > self.retry_after:
+            del self._errors[key]
+            return None
+        return failed[1]
+
+    def error(self, query: str) -> str | None:
+        with self._lock:
+            return self._recent_error(self.key(query))
+
+    def pending(self, query: str) -> bool:
+        with self._lock:
+            return self.key(query) in self._pending
+
+    def request(self, query: str) -> str | None:
+        """
+        Returns the cached summary of a query, or starts fetching it and returns None.
+        A query whose summary failed is only retried after `retry_after` seconds.
+        """
+        key = self.key(query)
+        with self._lock:
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+                return self._summaries[key]
+            if key in self._pending or self._recent_error(key) is not None:
+                return None
+            self._pending.add(key)
+        self._executor.submit(self._fetch, key, query)
+        return None
+
+    def _fetch(self, key: str, query: str):
+        try:
+            summary, error = self.generate(query), None
+        except Exception as e:
+            summary, error = None, str(e) or type(e).__name__
+        with self._lock:
+            self._pending.discard(key)
+            if error is not None:
+                self._errors[key] = (time.monotonic(), error)
+                self._errors.move_to_end(key)
+                while len(self._errors) > self.max_entries:
+                    self._errors.popitem(last=False)
+                return
+            self._summaries[key] = summary
+            while len(self._summaries) > self.max_entries:
+                self._summaries.popitem(last=False)
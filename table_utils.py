@@ -0,0 +1,116 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+LANG_SUFFIX = "_lang"
+
+
+def _is_link_column(series: pd.Series) -> bool:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Checking the distinct values is enough, and there are usually far fewer of them
+        categories = series.cat.categories
+        return categories.dtype == object and bool(categories.str.startswith("http", na=False).any())
+    if series.dtype != object:
+        return False
+    return bool(series.str.startswith("http", na=False).any())
+
+
+def column_metadata(df: pd.DataFrame) -> dict:
+    """
+    Describes the columns of a result once, so table views don't have to
+    scan the data on every rerun: which columns hold links (values starting
+    with "http"), which are numeric or datetimes, and which "<name>_lang"
+    columns carry the language tags of another column.
+    """
+    columns = list(df.columns)
+    lang = {column: column[:-len(LANG_SUFFIX)] for column in columns
+            if column.endswith(LANG_SUFFIX) and column[:-len(LANG_SUFFIX)] in columns}
+    return {
+        "link": [column for column in columns if _is_link_column(df[column])],
+        "numeric": [column for column in columns
+                    if pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])],
+        "datetime": [column for column in columns if pd.api.types.is_datetime64_any_dtype(df[column])],
+        "lang": lang,
+    }
+
+
+class ResultView:
+    """
+    Sorts, searches and pages one query result on the server, so a table
+    only has to send the rows it shows. Row orders are cached per search
+    and sort, and the searchable text of each column is built once, so
+    every table showing the same result shares the work.
+    """
+
+    def __init__(self, df: pd.DataFrame, version: int = 0, max_orders: int = 16):
+        self.df = df.reset_index(drop=True)
+        self.version = version
+        self.max_orders = max_orders
+        self._orders = OrderedDict()
+        self._text = {}
+
+    def _searchable(self, column: str) -> tuple[np.ndarray, np.ndarray | None]:
+        """
+        Returns lowercased text for a column: for categoricals the text of
+        each category plus the codes, otherwise the text of every row.
+        """
+        if column not in self._text:
+            series = self.df[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                text = series.cat.categories.astype(str).str.lower().to_numpy()
+                self._text[column] = (text, series.cat.codes.to_numpy())
+            else:
+                text = series.astype(str).str.lower().where(series.notna(), "").to_numpy()
+                self._text[column] = (text, None)
+        return self._text[column]
+
+    def _search(self, text: str) -> np.ndarray:
+        mask = np.zeros(len(self.df), dtype=bool)
+        for column in self.df.columns:
+            values, codes = self._searchable(column)
+            found = pd.Series(values, dtype=object).str.contains(text, regex=False).to_numpy(dtype=bool)
+            if codes is None:
+                mask |= found
+            else:
+                mask |= np.isin(codes, np.flatnonzero(found))
+        return np.flatnonzero(mask)
+
+    def _sort(self, rows: np.ndarray, column: str, ascending: bool) -> np.ndarray:
+        values = self.df[column].iloc[rows]
+        try:
+            order = values.sort_values(ascending=ascending, kind="stable", na_position="last")
+        except TypeError:
+            # Mixed types (e.g. numbers and strings in one column) sort by their text
+            order = values.astype(str).where(values.notna()).sort_values(
+                ascending=ascending, kind="stable", na_position="last"
+            )
+        return order.index.to_numpy()
+
+    def rows(self, search: str = "", sort_by: str | None = None, ascending: bool = True) -> np.ndarray:
+        """
+        Returns the positions of the rows containing `search` in any column
+        (ignoring case), ordered by `sort_by`.
+        """
+        key = (search.strip().lower(), sort_by, ascending)
+        if key in self._orders:
+            self._orders.move_to_end(key)
+            return self._orders[key]
+
+        rows = self._search(key[0]) if key[0] else np.arange(len(self.df))
+        if sort_by is not None and sort_by in self.df.columns:
+            rows = self._sort(rows, sort_by, ascending)
+        self._orders[key] = rows
+        while len(self._orders) > self.max_orders:
+            self._orders.popitem(last=False)
+        return rows
+
+    def page(self, page: int, page_size: int, search: str = "", sort_by: str | None = None,
+             ascending: bool = True) -> pd.DataFrame:
+        """
+        Returns one page (counting from 1) of the searched and sorted rows.
+        The row labels are the rows' positions in the full result.
+        """
+        rows = self.rows(search, sort_by, ascending)
+        start = (page - 1) * page_size
+        return self.df.iloc[rows[start:start + page_size]]
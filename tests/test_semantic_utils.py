@@ -0,0 +1,14 @@
+from semantic_utils import SemanticQueryCache
+
+
+def test_repeat_of_common_terms_is_found_in_a_large_cache():
+    cache = SemanticQueryCache(":memory:")
+    for i in range(20000):
+        cache.add(f"museum river town{i}", f"SELECT ?m WHERE {{ ?m ?p {i} }}")
+    cache.add("museum river", "SELECT ?m WHERE { ?m a dbo:Museum }")
+
+    results = cache.search("museum river")
+
+    assert results[0]["prompt"] == "museum river"
+    assert results[0]["score"] > 0.99
+    assert cache.match("Museums river!")["query"] == "SELECT ?m WHERE { ?m a dbo:Museum }"